@@ -0,0 +1,113 @@
+# -*- coding: UTF-8 -*-
+#
+# Per-frame cost of PyTurboJPEG calls on camera-sized frames.
+#
+#   python benchmark.py [--lib PATH] [--width 640] [--height 480] [--frames 500]
+#
+# Every case is timed over the same synthetic JPEG (NAO's camera is 640x480 by
+# default). "per call" creates and destroys a libjpeg-turbo handle on every call,
+# "pooled" reuses one handle per thread. decode_batch is then timed with an
+# increasing number of worker threads.
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from turbojpeg import TurboJPEG, FrameRing, TJPF_GRAY
+
+
+def synthetic_frame(width, height, seed=0):
+    """a BGR frame with gradients and noise, so it compresses like a camera image"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+    frame = np.stack([
+        x * 255 // max(width - 1, 1),
+        y * 255 // max(height - 1, 1),
+        (x + y) * 255 // max(width + height - 2, 1)
+    ], axis=-1).astype(np.int16)
+    frame += rng.integers(-12, 13, frame.shape, dtype=np.int16)
+    return np.clip(frame, 0, 255).astype(np.uint8)
+
+
+def per_frame(func, frames):
+    """seconds per call of func(), after a few warm-up calls"""
+    for _ in range(min(frames, 10)):
+        func()
+    start = time.perf_counter()
+    for _ in range(frames):
+        func()
+    return (time.perf_counter() - start) / frames
+
+
+def cases(jpeg, jpeg_buf, frame):
+    """name -> function to time"""
+    ring = FrameRing(jpeg)
+    luma_ring = FrameRing(jpeg, luma=True)
+    return {
+        'decode_header': lambda: jpeg.decode_header(jpeg_buf),
+        'decode': lambda: jpeg.decode(jpeg_buf),
+        'decode_into (ring)': lambda: ring.decode(jpeg_buf),
+        'decode (TJPF_GRAY)': lambda: jpeg.decode(jpeg_buf, pixel_format=TJPF_GRAY),
+        'decode_luma': lambda: jpeg.decode_luma(jpeg_buf),
+        'decode_luma (ring)': lambda: luma_ring.decode(jpeg_buf),
+        'encode': lambda: jpeg.encode(frame),
+        'crop': lambda: jpeg.crop(jpeg_buf, 0, 0, frame.shape[1] // 2, frame.shape[0] // 2),
+        'decode_scaled (1/2)': lambda: jpeg.decode_scaled(jpeg_buf, frame.shape[1] // 2, frame.shape[0] // 2),
+        'decode_roi (1/4 area)': lambda: jpeg.decode_roi(
+            jpeg_buf, frame.shape[1] // 4, frame.shape[0] // 4, frame.shape[1] // 2, frame.shape[0] // 2),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Per-frame cost of PyTurboJPEG calls.')
+    parser.add_argument('--lib', help='path of libturbojpeg, found automatically by default')
+    parser.add_argument('--width', type=int, default=640)
+    parser.add_argument('--height', type=int, default=480)
+    parser.add_argument('--frames', type=int, default=500)
+    args = parser.parse_args(argv)
+
+    per_call = TurboJPEG(args.lib, pool_handles=False)
+    pooled = TurboJPEG(args.lib)
+
+    frame = synthetic_frame(args.width, args.height)
+    jpeg_buf = pooled.encode(frame)
+    print('{}x{} frame, {} bytes as JPEG, {} frames per case'.format(
+        args.width, args.height, len(jpeg_buf), args.frames))
+    print('{:24} {:>12} {:>12} {:>8}'.format('', 'per call', 'pooled', 'speedup'))
+
+    before = cases(per_call, jpeg_buf, frame)
+    after = cases(pooled, jpeg_buf, frame)
+    for name in after:
+        old = per_frame(before[name], args.frames)
+        new = per_frame(after[name], args.frames)
+        print('{:24} {:>10.1f}us {:>10.1f}us {:>7.2f}x'.format(name, old * 1e6, new * 1e6, old / new))
+
+    print()
+    batch_scaling(args.lib, jpeg_buf, args.frames)
+
+    pooled.close()
+
+
+def batch_scaling(lib, jpeg_buf, frames):
+    """frames per second of decode_batch for 1, 2, 4, ... workers"""
+    batch = [jpeg_buf] * max(frames // 4, 16)
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    if counts[-1] != (os.cpu_count() or 1):
+        counts.append(os.cpu_count())
+
+    print('decode_batch of {} frames'.format(len(batch)))
+    print('{:24} {:>12} {:>8}'.format('workers', 'frames/s', 'scaling'))
+    base = None
+    for count in counts:
+        with TurboJPEG(lib, batch_workers=count) as jpeg:
+            fps = len(batch) / per_frame(lambda: jpeg.decode_batch(batch), 3)
+        base = base or fps
+        print('{:24} {:>12.0f} {:>7.2f}x'.format(count, fps, fps / base))
+
+
+if __name__ == '__main__':
+    main()
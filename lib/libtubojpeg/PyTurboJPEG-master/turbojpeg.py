@@ -32,6 +32,9 @@ import numpy as np
 import math
 import warnings
 import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from struct import unpack, calcsize
 
 # default libTurboJPEG library path
@@ -284,6 +287,12 @@ def fill_background(coeffs_ptr, arrayRegion, planeRegion, componentID, transform
     return 1
 
 
+def tjScaled(dimension, scaling_factor):
+    """Image dimension after decoding with scaling_factor (num, denom), as TJSCALED."""
+    num, denom = scaling_factor
+    return (dimension * num + denom - 1) // denom
+
+
 def split_byte_into_nibbles(value):
     """Split byte int into 2 nibbles (4 bits)."""
     first = value >> 4
@@ -291,9 +300,36 @@ def split_byte_into_nibbles(value):
     return first, second
 
 
+class _Handle(object):
+    """A tjhandle owned by one thread, destroyed when the thread ends or on close().
+
+    busy counts the calls using it; close() leaves a busy handle to the call that
+    releases it last.
+    """
+    __slots__ = ('value', 'generation', 'busy', 'destroy', '__weakref__')
+
+    def __init__(self, value, generation, destroy):
+        self.value = value
+        self.generation = generation
+        self.busy = 0
+        # Runs once: when the thread (and so this handle) is gone, or from close() / release
+        self.destroy = weakref.finalize(self, destroy, value)
+
+
 class TurboJPEG(object):
-    """A Python wrapper of libjpeg-turbo for decoding and encoding JPEG image."""
-    def __init__(self, lib_path=None):
+    """A Python wrapper of libjpeg-turbo for decoding and encoding JPEG image.
+
+    Decompress, compress and transform handles are created once per thread and
+    reused for every call from that thread (pool_handles=False creates and destroys
+    one per call instead). A thread's handles are destroyed when the thread ends;
+    close() (or leaving a with block) destroys all of them, later calls create new
+    ones. A handle that is in use by a call on another thread during close() is
+    destroyed when that call returns.
+
+    decode_batch() decodes on a pool of batch_workers threads (default: one per
+    CPU), started on first use and stopped by close().
+    """
+    def __init__(self, lib_path=None, pool_handles=True, batch_workers=None):
         turbo_jpeg = cdll.LoadLibrary(
             self.__find_turbojpeg() if lib_path is None else lib_path)
         self.__init_decompress = turbo_jpeg.tjInitDecompress
@@ -345,6 +381,11 @@ class TurboJPEG(object):
             c_void_p, POINTER(c_ubyte), c_int, c_int, c_int, c_int,
             POINTER(c_void_p), POINTER(c_ulong), c_int, c_int]
         self.__compressFromYUV.restype = c_int
+        self.__compressFromYUVPlanes = turbo_jpeg.tjCompressFromYUVPlanes
+        self.__compressFromYUVPlanes.argtypes = [
+            c_void_p, POINTER(POINTER(c_ubyte)), c_int, POINTER(c_int), c_int, c_int,
+            POINTER(c_void_p), POINTER(c_ulong), c_int, c_int]
+        self.__compressFromYUVPlanes.restype = c_int
         self.__init_transform = turbo_jpeg.tjInitTransform
         self.__init_transform.restype = c_void_p
         self.__transform = turbo_jpeg.tjTransform
@@ -378,11 +419,101 @@ class TurboJPEG(object):
             for i in range(num_scaling_factors.value)
         )
 
+        self.__pool_handles = pool_handles
+        self.__init_handle = {
+            'decompress': self.__init_decompress,
+            'compress': self.__init_compress,
+            'transform': self.__init_transform
+        }
+        self.__local = threading.local()
+        # weak references to the pooled _Handles of all threads
+        self.__handles = []
+        self.__lock = threading.Lock()
+        self.__generation = 0
+        self.__batch_workers = batch_workers or os.cpu_count() or 1
+        self.__executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # __init__ may have failed before the pool existed
+        if getattr(self, '_TurboJPEG__handles', None) or getattr(self, '_TurboJPEG__executor', None):
+            # The last reference may go away on a decode_batch worker, which can't join itself
+            self.__close(wait=False)
+
+    def close(self):
+        """stops the decode_batch workers and destroys the handles of all threads."""
+        self.__close(wait=True)
+
+    def __close(self, wait):
+        """close(), wait=False doesn't wait for the decode_batch workers to finish"""
+        with self.__lock:
+            executor = self.__executor
+            self.__executor = None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+        with self.__lock:
+            handles = [ref() for ref in self.__handles]
+            self.__handles = []
+            self.__generation += 1
+            # Handles in use are destroyed by __release
+            idle = [handle for handle in handles if handle is not None and not handle.busy]
+        for handle in idle:
+            handle.destroy()
+
+    def __acquire(self, kind):
+        """returns a handle of kind ('decompress', 'compress' or 'transform') for this thread"""
+        if not self.__pool_handles:
+            return self.__create(kind)
+        handle = getattr(self.__local, kind, None)
+        with self.__lock:
+            # Checked and marked busy together, so close() can't destroy it in between
+            if handle is not None and handle.generation == self.__generation:
+                handle.busy += 1
+                return handle.value
+        value = self.__create(kind)
+        with self.__lock:
+            handle = _Handle(value, self.__generation, self.__destroy)
+            handle.busy = 1
+            self.__handles = [ref for ref in self.__handles if ref() is not None]
+            self.__handles.append(weakref.ref(handle))
+        setattr(self.__local, kind, handle)
+        return value
+
+    def __release(self, handle):
+        """gives back a handle from __acquire"""
+        if not handle:
+            return
+        if not self.__pool_handles:
+            self.__destroy(handle)
+            return
+        for kind in self.__init_handle:
+            pooled = getattr(self.__local, kind, None)
+            if pooled is not None and pooled.value == handle:
+                break
+        else:
+            return
+        with self.__lock:
+            pooled.busy -= 1
+            closed = not pooled.busy and pooled.generation != self.__generation
+        if closed:
+            pooled.destroy()
+
+    def __create(self, kind):
+        handle = self.__init_handle[kind]()
+        if not handle:
+            raise IOError(self.__get_error_string(None))
+        return handle
+
     def decode_header(self, jpeg_buf):
         """decodes JPEG header and returns image properties as a tuple.
            e.g. (width, height, jpeg_subsample, jpeg_colorspace)
         """
-        handle = self.__init_decompress()
+        handle = self.__acquire('decompress')
         try:
             width = c_int()
             height = c_int()
@@ -397,11 +528,11 @@ class TurboJPEG(object):
                 self.__report_error(handle)
             return (width.value, height.value, jpeg_subsample.value, jpeg_colorspace.value)
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
 
     def decode(self, jpeg_buf, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
         """decodes JPEG memory buffer to numpy array."""
-        handle = self.__init_decompress()
+        handle = self.__acquire('decompress')
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
@@ -418,11 +549,123 @@ class TurboJPEG(object):
                 self.__report_error(handle)
             return img_array
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
+
+    def decode_shape(self, jpeg_buf, pixel_format=TJPF_BGR, scaling_factor=None):
+        """returns the shape of the numpy array decode() returns for a JPEG buffer.
+           e.g. (height, width, channels)
+        """
+        handle = self.__acquire('decompress')
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            scaled_width, scaled_height, _, _ = \
+                self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
+            return (scaled_height, scaled_width, tjPixelSize[pixel_format])
+        finally:
+            self.__release(handle)
+
+    def decode_into(self, jpeg_buf, out, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
+        """decodes JPEG memory buffer into a preallocated numpy array.
+           out is a uint8 array of shape (height, width, channels) at least as large
+           as the (scaled) image, with contiguous rows. Returns the view of out that
+           holds the image, nothing is allocated for the pixels.
+        """
+        channels = tjPixelSize[pixel_format]
+        if out.dtype != np.uint8 or out.ndim != 3 or out.shape[2] != channels or \
+                out.strides[2] != 1 or out.strides[1] != channels:
+            raise ValueError('out must be a uint8 array of shape (height, width, {}) '
+                'with contiguous rows'.format(channels))
+        handle = self.__acquire('decompress')
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            scaled_width, scaled_height, _, _ = \
+                self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
+            if out.shape[0] < scaled_height or out.shape[1] < scaled_width:
+                raise ValueError('out is {}x{}, the image is {}x{}'.format(
+                    out.shape[1], out.shape[0], scaled_width, scaled_height))
+            dest_addr = self.__getaddr(out)
+            status = self.__decompress(
+                handle, src_addr, jpeg_array.size, dest_addr, scaled_width,
+                out.strides[0], scaled_height, pixel_format, flags)
+            if status != 0:
+                self.__report_error(handle)
+            return out[:scaled_height, :scaled_width]
+        finally:
+            self.__release(handle)
+
+    def decode_batch(self, jpeg_bufs, pixel_format=TJPF_BGR, scaling_factor=None, flags=0, stack=True):
+        """decodes a list of JPEG memory buffers in parallel.
+           Each worker thread decodes with its own handle (ctypes releases the GIL
+           during the call). With stack=True all images must have the same size and
+           are decoded straight into one array of shape (n, height, width, channels),
+           otherwise a list of arrays is returned.
+        """
+        jpeg_bufs = list(jpeg_bufs)
+        if not jpeg_bufs:
+            if stack:
+                return np.empty((0, 0, 0, tjPixelSize[pixel_format]), dtype=np.uint8)
+            return []
+        executor = self.__workers()
+
+        if not stack:
+            return list(executor.map(
+                lambda jpeg_buf: self.decode(jpeg_buf, pixel_format, scaling_factor, flags),
+                jpeg_bufs))
+
+        shapes = set(self.decode_shape(jpeg_buf, pixel_format, scaling_factor) for jpeg_buf in jpeg_bufs)
+        if len(shapes) > 1:
+            raise ValueError('images of different sizes cannot be stacked: ' + str(sorted(shapes)))
+        out = np.empty((len(jpeg_bufs),) + shapes.pop(), dtype=np.uint8)
+        # list() so the first failed decode raises here
+        list(executor.map(
+            lambda i: self.decode_into(jpeg_bufs[i], out[i], pixel_format, scaling_factor, flags),
+            range(len(jpeg_bufs))))
+        return out
+
+    def __workers(self):
+        """returns the decode_batch thread pool, started on first use"""
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.__batch_workers, thread_name_prefix='turbojpeg')
+            return self.__executor
+
+    def scaling_factor_for(self, width, height, min_width, min_height):
+        """returns the smallest supported scaling factor that keeps a width x height
+           image at least min_width x min_height, e.g. the input size of a detector.
+           (1, 1) if no factor below 1 does.
+        """
+        best = (1, 1)
+        for factor in self.__scaling_factors:
+            if factor[0] * best[1] < best[0] * factor[1] and \
+                    tjScaled(width, factor) >= min_width and tjScaled(height, factor) >= min_height:
+                best = factor
+        return best
+
+    def decode_scaled(self, jpeg_buf, min_width, min_height, pixel_format=TJPF_BGR, flags=0):
+        """decodes JPEG memory buffer at the smallest DCT scale that is still at
+           least min_width x min_height, so no pixels are decoded only to be
+           downscaled again. Returns the image and the scaling factor used.
+        """
+        width, height, _, _ = self.decode_header(jpeg_buf)
+        scaling_factor = self.scaling_factor_for(width, height, min_width, min_height)
+        return self.decode(jpeg_buf, pixel_format, scaling_factor, flags), scaling_factor
+
+    def decode_roi(self, jpeg_buf, x, y, w, h, pixel_format=TJPF_BGR, scaling_factor=None, flags=0):
+        """decodes only a region of a JPEG image, e.g. around the last known face.
+           The region is widened to the MCU grid and losslessly cropped (see crop)
+           before decoding. Returns the image and the (x, y) of its top left corner
+           in the full image, in full image pixels.
+        """
+        x, y = max(int(x), 0), max(int(y), 0)
+        cropped, (x, y, _, _) = self.__crop(jpeg_buf, x, y, int(w), int(h), False, False)
+        return self.decode(cropped, pixel_format, scaling_factor, flags), (x, y)
 
     def decode_to_yuv(self, jpeg_buf, scaling_factor=None, pad=4, flags=0):
         """decodes JPEG memory buffer to yuv array."""
-        handle = self.__init_decompress()
+        handle = self.__acquire('decompress')
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
@@ -445,41 +688,90 @@ class TurboJPEG(object):
                         self.__plane_width(i, scaled_width, jpeg_subsample)))
             return buffer_array, plane_sizes
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
 
-    def decode_to_yuv_planes(self, jpeg_buf, scaling_factor=None, strides=(0, 0, 0), flags=0):
-        """decodes JPEG memory buffer to yuv planes."""
-        handle = self.__init_decompress()
+    def yuv_plane_shapes(self, jpeg_buf, scaling_factor=None):
+        """returns the (height, width) of each yuv plane of a JPEG buffer,
+           one plane for grayscale images, three otherwise.
+        """
+        handle = self.__acquire('decompress')
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
             scaled_width, scaled_height, jpeg_subsample, _ = \
                 self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
-            num_planes = 3
-            if jpeg_subsample == TJSAMP_GRAY:
-                num_planes = 1
+            return self.__plane_shapes(scaled_width, scaled_height, jpeg_subsample)
+        finally:
+            self.__release(handle)
+
+    def decode_to_yuv_planes(self, jpeg_buf, scaling_factor=None, strides=(0, 0, 0), flags=0, out=None):
+        """decodes JPEG memory buffer to yuv planes.
+           out is an optional list of preallocated uint8 planes (2-D, contiguous
+           rows, at least yuv_plane_shapes() large) to decode into; their row
+           strides are used instead of strides.
+        """
+        return self.__decode_planes(jpeg_buf, scaling_factor, strides, flags, out)[0]
+
+    def decode_luma(self, jpeg_buf, scaling_factor=None, flags=0, out=None):
+        """decodes the luminance of a JPEG memory buffer, e.g. for detectors that
+           work on grayscale. Built on decode_to_yuv_planes: no color conversion or
+           chroma upsampling is done, the result is a (height, width) view of the Y
+           plane (no copy), cropped to the (scaled) image size. out is passed on to
+           decode_to_yuv_planes.
+        """
+        planes, (height, width) = self.__decode_planes(jpeg_buf, scaling_factor, (0, 0, 0), flags, out)
+        return planes[0][:height, :width]
+
+    def __decode_planes(self, jpeg_buf, scaling_factor, strides, flags, out):
+        """decode_to_yuv_planes, returns the planes and the (height, width) of the image.
+           The planes are padded to whole MCUs, so they can be larger than the image.
+        """
+        handle = self.__acquire('decompress')
+        try:
+            jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
+            src_addr = self.__getaddr(jpeg_array)
+            scaled_width, scaled_height, jpeg_subsample, _ = \
+                self.__get_header_and_dimensions(handle, jpeg_array.size, src_addr, scaling_factor)
+            shapes = self.__plane_shapes(scaled_width, scaled_height, jpeg_subsample)
+            num_planes = len(shapes)
+            if out is not None and (len(out) != num_planes or any(
+                    plane.dtype != np.uint8 or plane.ndim != 2 or plane.strides[1] != 1 or
+                    plane.shape[0] < shape[0] or plane.shape[1] < shape[1]
+                    for plane, shape in zip(out, shapes))):
+                raise ValueError('out must be {} uint8 planes of at least {}'.format(num_planes, shapes))
             strides_addr = (c_int * num_planes)()
             dest_addr = (POINTER(c_ubyte) * num_planes)()
             planes = list()
             for i in range(num_planes):
-                if strides[i] == 0:
-                    strides_addr[i] = self.__plane_width(i, scaled_width, jpeg_subsample)
+                if out is not None:
+                    planes.append(out[i])
+                    strides_addr[i] = out[i].strides[0]
                 else:
-                    strides_addr[i] = strides[i]
-                planes.append(np.empty(
-                    (self.__plane_height(i, scaled_height, jpeg_subsample), strides_addr[i]), dtype=np.uint8))
+                    if strides[i] == 0:
+                        strides_addr[i] = shapes[i][1]
+                    else:
+                        strides_addr[i] = strides[i]
+                    planes.append(np.empty((shapes[i][0], strides_addr[i]), dtype=np.uint8))
                 dest_addr[i] = self.__getaddr(planes[i])
             status = self.__decompressToYUVPlanes(
                 handle, src_addr, jpeg_array.size, dest_addr, scaled_width, strides_addr, scaled_height, flags)
             if status != 0:
                 self.__report_error(handle)
-            return planes
+            return planes, (scaled_height, scaled_width)
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
+
+    def __plane_shapes(self, width, height, jpeg_subsample):
+        """returns the (height, width) of each yuv plane"""
+        num_planes = 1 if jpeg_subsample == TJSAMP_GRAY else 3
+        return [
+            (self.__plane_height(i, height, jpeg_subsample), self.__plane_width(i, width, jpeg_subsample))
+            for i in range(num_planes)
+        ]
 
     def encode(self, img_array, quality=85, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_422, flags=0):
         """encodes numpy array to JPEG memory buffer."""
-        handle = self.__init_compress()
+        handle = self.__acquire('compress')
         try:
             jpeg_buf = c_void_p()
             jpeg_size = c_ulong()
@@ -498,11 +790,11 @@ class TurboJPEG(object):
             self.__free(jpeg_buf)
             return dest_buf.raw
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
 
     def encode_from_yuv(self, img_array, height, width, quality=85, jpeg_subsample=TJSAMP_420, flags=0):
         """encodes numpy array to JPEG memory buffer."""
-        handle = self.__init_compress()
+        handle = self.__acquire('compress')
         try:
             jpeg_buf = c_void_p()
             jpeg_size = c_ulong()
@@ -517,11 +809,55 @@ class TurboJPEG(object):
             self.__free(jpeg_buf)
             return dest_buf.raw
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
+
+    def encode_from_yuv_planes(self, planes, quality=85, jpeg_subsample=None, flags=0, height=None, width=None):
+        """encodes yuv planes (e.g. from decode_to_yuv_planes) to JPEG memory buffer.
+           A single plane is encoded as grayscale, e.g. the result of decode_luma;
+           three planes need their jpeg_subsample (TJSAMP_420 by default).
+           height and width are the image size and default to the shape of the Y
+           plane. Planes from decode_to_yuv_planes are padded to whole MCUs, pass
+           the image size (e.g. from decode_header) to keep it.
+        """
+        num_planes = len(planes)
+        if num_planes not in (1, 3):
+            raise ValueError('expected 1 (grayscale) or 3 yuv planes')
+        if jpeg_subsample is None:
+            jpeg_subsample = TJSAMP_GRAY if num_planes == 1 else TJSAMP_420
+        if (jpeg_subsample == TJSAMP_GRAY) != (num_planes == 1):
+            raise ValueError('TJSAMP_GRAY takes 1 plane, other subsamples 3')
+        for plane in planes:
+            if plane.dtype != np.uint8 or plane.ndim != 2 or plane.strides[1] != 1:
+                raise ValueError('yuv planes must be 2-D uint8 arrays with contiguous rows')
+        height = planes[0].shape[0] if height is None else height
+        width = planes[0].shape[1] if width is None else width
+        shapes = self.__plane_shapes(width, height, jpeg_subsample)
+        if any(plane.shape[0] < shape[0] or plane.shape[1] < shape[1] for plane, shape in zip(planes, shapes)):
+            raise ValueError('a {}x{} image needs planes of at least {}'.format(width, height, shapes))
+        handle = self.__acquire('compress')
+        try:
+            strides_addr = (c_int * num_planes)()
+            src_addr = (POINTER(c_ubyte) * num_planes)()
+            for i, plane in enumerate(planes):
+                strides_addr[i] = plane.strides[0]
+                src_addr[i] = self.__getaddr(plane)
+            jpeg_buf = c_void_p()
+            jpeg_size = c_ulong()
+            status = self.__compressFromYUVPlanes(
+                handle, src_addr, width, strides_addr, height, jpeg_subsample,
+                byref(jpeg_buf), byref(jpeg_size), quality, flags)
+            if status != 0:
+                self.__report_error(handle)
+            dest_buf = create_string_buffer(jpeg_size.value)
+            memmove(dest_buf, jpeg_buf.value, jpeg_size.value)
+            self.__free(jpeg_buf)
+            return dest_buf.raw
+        finally:
+            self.__release(handle)
 
     def scale_with_quality(self, jpeg_buf, scaling_factor=None, quality=85, flags=0):
         """decompresstoYUV with scale factor, recompresstoYUV with quality factor"""
-        handle = self.__init_decompress()
+        handle = self.__acquire('decompress')
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
@@ -535,8 +871,9 @@ class TurboJPEG(object):
                 handle, src_addr, jpeg_array.size, dest_addr, scaled_width, 4, scaled_height, flags)
             if status != 0:
                 self.__report_error(handle)
-            self.__destroy(handle)
-            handle = self.__init_compress()
+            self.__release(handle)
+            handle = None
+            handle = self.__acquire('compress')
             jpeg_buf = c_void_p()
             jpeg_size = c_ulong()
             status = self.__compressFromYUV(
@@ -549,11 +886,15 @@ class TurboJPEG(object):
             self.__free(jpeg_buf)
             return dest_buf.raw
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
 
     def crop(self, jpeg_buf, x, y, w, h, preserve=False, gray=False):
         """losslessly crop a jpeg image with optional grayscale"""
-        handle = self.__init_transform()
+        return self.__crop(jpeg_buf, x, y, w, h, preserve, gray)[0]
+
+    def __crop(self, jpeg_buf, x, y, w, h, preserve, gray):
+        """crop() that also returns the MCU aligned region (x, y, w, h) it cropped"""
+        handle = self.__acquire('transform')
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
@@ -583,9 +924,9 @@ class TurboJPEG(object):
             self.__free(dest_array)
             if status != 0:
                 self.__report_error(handle)
-            return dest_buf.raw
+            return dest_buf.raw, (x, y, w, h)
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
 
     def crop_multiple(self, jpeg_buf, crop_parameters, background_luminance=1.0, gray=False):
         """Lossless crop and/or extension operations on jpeg image.
@@ -610,7 +951,7 @@ class TurboJPEG(object):
         List[bytes]
             Cropped and/or extended jpeg images.
         """
-        handle = self.__init_transform()
+        handle = self.__acquire('transform')
         try:
             jpeg_array = np.frombuffer(jpeg_buf, dtype=np.uint8)
             src_addr = self.__getaddr(jpeg_array)
@@ -703,7 +1044,7 @@ class TurboJPEG(object):
             return results
 
         finally:
-            self.__destroy(handle)
+            self.__release(handle)
 
     def __get_header_and_dimensions(self, handle, jpeg_array_size, src_addr, scaling_factor):
         """returns scaled image dimensions and header data"""
@@ -723,12 +1064,8 @@ class TurboJPEG(object):
         scaled_width = width.value
         scaled_height = height.value
         if scaling_factor is not None:
-            def get_scaled_value(dim, num, denom):
-                return (dim * num + denom - 1) // denom
-            scaled_width = get_scaled_value(
-                scaled_width, scaling_factor[0], scaling_factor[1])
-            scaled_height = get_scaled_value(
-                scaled_height, scaling_factor[0], scaling_factor[1])
+            scaled_width = tjScaled(scaled_width, scaling_factor)
+            scaled_height = tjScaled(scaled_height, scaling_factor)
         return scaled_width, scaled_height, jpeg_subsample, jpeg_colorspace
 
     def __axis_to_image_boundaries(self, a, b, img_boundary, preserve, mcuBlock):
@@ -936,6 +1273,63 @@ class TurboJPEG(object):
     def scaling_factors(self):
         return self.__scaling_factors
 
+class FrameRing(object):
+    """A ring of preallocated frame buffers to decode a JPEG video stream into.
+
+    The buffers are sized from the header of the first frame (and grown when a
+    larger frame arrives), then reused round robin: in steady state decoding a
+    frame allocates no pixel memory. A decoded frame is a view of its buffer and
+    stays valid until size more frames are decoded, so a consumer must copy or
+    drop frames it holds on to longer (e.g. use a queue of at most size - 1).
+
+    With luma=True frames are decoded with decode_luma into a set of yuv planes
+    per buffer and are (height, width) views of the Y plane, for consumers that
+    only need grayscale (pixel_format is not used then).
+    """
+    def __init__(self, jpeg, size=4, pixel_format=TJPF_BGR, scaling_factor=None, flags=0, luma=False):
+        if size < 1:
+            raise ValueError('a frame ring needs at least one buffer')
+        self.jpeg = jpeg
+        self.size = size
+        self.pixel_format = pixel_format
+        self.scaling_factor = scaling_factor
+        self.flags = flags
+        self.luma = luma
+        self.__buffers = None
+        self.__planes = [None] * size
+        self.__next = 0
+
+    @property
+    def shape(self):
+        """(size, height, width, channels) of the pixel buffers, None before the first frame or with luma"""
+        return None if self.__buffers is None else self.__buffers.shape
+
+    def decode(self, jpeg_buf):
+        """decodes the next frame into the ring and returns it."""
+        if self.luma:
+            return self.__decode_luma(jpeg_buf)
+        height, width, channels = self.jpeg.decode_shape(
+            jpeg_buf, self.pixel_format, self.scaling_factor)
+        buffers = self.__buffers
+        if buffers is None or buffers.shape[1] < height or buffers.shape[2] < width:
+            if buffers is not None:
+                height, width = max(height, buffers.shape[1]), max(width, buffers.shape[2])
+            buffers = self.__buffers = np.empty(
+                (self.size, height, width, channels), dtype=np.uint8)
+        out = buffers[self.__next]
+        self.__next = (self.__next + 1) % self.size
+        return self.jpeg.decode_into(
+            jpeg_buf, out, self.pixel_format, self.scaling_factor, self.flags)
+
+    def __decode_luma(self, jpeg_buf):
+        shapes = self.jpeg.yuv_plane_shapes(jpeg_buf, self.scaling_factor)
+        planes = self.__planes[self.__next]
+        if planes is None or len(planes) != len(shapes) or any(
+                plane.shape[0] < shape[0] or plane.shape[1] < shape[1] for plane, shape in zip(planes, shapes)):
+            planes = self.__planes[self.__next] = [np.empty(shape, dtype=np.uint8) for shape in shapes]
+        self.__next = (self.__next + 1) % self.size
+        return self.jpeg.decode_luma(jpeg_buf, self.scaling_factor, self.flags, out=planes)
+
 if __name__ == '__main__':
     jpeg = TurboJPEG()
     in_file = open('input.jpg', 'rb')
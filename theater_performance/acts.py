@@ -0,0 +1,90 @@
+"""
+The acts of the show and the scripted intents that belong to each of them.
+"""
+from theater_performance.config import INITIAL_ACT
+
+
+# Act -> its scripted intents (see DialogflowHandler.scripted_intents)
+ACTS = {
+    "INTRODUCTION": [
+        "welcome_intent", "feel_question", "feel_game", "denial_intro", "seeing_not_change",
+    ],
+    "DENIAL": [
+        "confident_nao", "practice_show", "denial_response", "denial_statement",
+        "denial_count_beats", "lacks_structure", "denial_swing",
+    ],
+    "DOUBT": [
+        "doubt_baseball_choreo", "doubt_watch_this", "your_turn", "doubt_thats_dancing",
+        "doubt_told_you_dance", "doubt_which_means_dancing",
+    ],
+    "LEARNING": [
+        "learn_dont_dance", "learn_try", "what_you_got", "learn_got_style", "learn_grooving_is_dancing",
+    ],
+    "ACCEPTANCE": [
+        "accept_can_dance", "dance_algorithm", "accept_exactly",
+    ],
+}
+
+# Act -> the acts a beat may come from while in it: the act itself and the next one
+TRANSITIONS = {
+    "INTRODUCTION": ("INTRODUCTION", "DENIAL"),
+    "DENIAL": ("DENIAL", "DOUBT"),
+    "DOUBT": ("DOUBT", "LEARNING"),
+    "LEARNING": ("LEARNING", "ACCEPTANCE"),
+    "ACCEPTANCE": ("ACCEPTANCE",),
+}
+
+
+class ActStateMachine:
+    """
+    Tracks the act the show is in.
+
+    The allowed intents per act (its own and those of the acts it may move on to)
+    are computed once from ACTS and TRANSITIONS. advance() moves to the act of a
+    performed scripted beat; a beat from an act that is not a transition is still
+    followed (the actors lead) but logged as out of sequence.
+    """
+
+    def __init__(self, acts=ACTS, transitions=TRANSITIONS, initial=INITIAL_ACT, logger=None):
+        self.transitions = transitions
+        self.logger = logger
+        self.state = initial
+
+        self.act_of = {intent: act for act, intents in acts.items() for intent in intents}
+        self.own = {act: frozenset(intents) for act, intents in acts.items()}
+        self.allowed = {
+            act: frozenset(intent for target in targets for intent in acts[target])
+            for act, targets in transitions.items()
+        }
+
+    def candidates(self):
+        """The scripted intents that can come next."""
+        return self.allowed[self.state]
+
+    def settled(self):
+        """
+        The scripted intents that can come next without moving the show on.
+
+        Those of the current act, none in the last act (its beats end the show).
+        The local matcher only fires these, CX decides on everything else.
+        """
+        if self.transitions[self.state] == (self.state,):
+            return frozenset()
+        return self.own[self.state]
+
+    def advance(self, intent_name):
+        """Move to the act of a scripted intent, returns False if it was out of sequence."""
+        act = self.act_of.get(intent_name)
+        if act is None or act == self.state:
+            return True
+
+        in_sequence = act in self.transitions[self.state]
+        if self.logger:
+            note = "" if in_sequence else " (out of sequence)"
+            self.logger.info(f"Act {self.state} -> {act} on '{intent_name}'{note}")
+        self.state = act
+        return in_sequence
+
+    def check(self, scripted_intents):
+        """Scripted intents that belong to no act (the local matcher never picks those)."""
+        return [intent for intent in scripted_intents if intent not in self.act_of]
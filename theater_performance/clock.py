@@ -0,0 +1,40 @@
+"""
+Show clock.
+
+Code that waits for or measures show time goes through here instead of the time
+module, so the replay harness can run a whole show faster than real time with
+set_speed(). At the default speed of 1 these are plain time.* calls.
+"""
+import time
+
+_speed = 1.0
+
+
+def set_speed(speed):
+    """Run the show clock speed times faster than real time."""
+    global _speed
+    if speed <= 0:
+        raise ValueError("Clock speed must be positive.")
+    _speed = float(speed)
+
+
+def speed():
+    return _speed
+
+
+def monotonic():
+    return time.monotonic() * _speed
+
+
+def perf_counter():
+    return time.perf_counter() * _speed
+
+
+def sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds / _speed)
+
+
+def wait(event, seconds):
+    """event.wait(seconds) in show time, returns True if the event was set."""
+    return event.wait(None if seconds is None else seconds / _speed)
@@ -5,6 +5,9 @@ Central configuration for theater performance.
 # NAO robot IP
 NAO_IP = "192.168.0.231"
 
+# First line of the show, said before anything is heard
+OPENING_LINE = "Hello, I am Cody, nice to meet you!"
+
 
 
 # Dialogflow
@@ -12,7 +15,116 @@ DIALOGFLOW_KEYFILE = "conf/google/google-key.json"
 DIALOGFLOW_AGENT_ID = "3e375e92-66e0-42f9-8882-0f3f97988c0e"
 DIALOGFLOW_LOCATION = "europe-west4"
 
+# Act the show starts in (see acts)
+INITIAL_ACT = "INTRODUCTION"
+
 # LLM model settings
 LLM_MODEL = "gpt-4o-mini"
 LLM_TEMP = 0.8
 LLM_MAX_TOKENS = 80
+# Everything sent for a fallback reply (persona, earlier exchanges, question) fits in
+# this many tokens, the oldest exchanges are left out first
+LLM_PROMPT_TOKENS = 400
+# Earlier exchanges remembered for the prompt
+LLM_HISTORY_TURNS = 4
+# Show seconds until a fallback reply has words for NAO (the first token when
+# streaming); after that NAO says one of llm_handler.FALLBACK_LINES instead
+LLM_DEADLINE = 3.0
+# A request slower than this percentile of the earlier ones is hedged with a second one
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_DELAY = 1.5               # seconds, until LLM_HEDGE_MIN_SAMPLES requests were answered
+LLM_HEDGE_MIN_SAMPLES = 5
+
+# Motion library (decoded recordings kept in memory, LRU by file size)
+MOTION_CACHE_MAX_BYTES = 16 * 1024 * 1024
+
+# Keyframe reduction of recorded motions (motion_keyframes), max angle error in radians
+MOTION_KEYFRAME_TOLERANCE = 0.01
+
+# Motion retiming (tempo / speed per beat, see motion_retime)
+# Retimed recordings kept in memory, by (motion, tempo, speed)
+MOTION_RETIME_CACHE_SIZE = 32
+# Samples per second of a retimed recording (the recorder samples at ~20 Hz)
+MOTION_RESAMPLE_RATE = 20.0
+# Moving-average window (samples) applied after resampling, 1 = off
+MOTION_SMOOTHING = 1
+# Recorded tempo (BPM) per motion, motions not listed here are estimated
+MOTION_BPM = {}
+# Posture speed (0-1) used to take the joints over from a recorded motion that is cut short
+MOTION_STOP_SPEED = 1.0
+
+# Show loop (listen / decide / act run concurrently, see show_loop)
+# Listen for the next line while NAO is still performing
+PIPELINED_TURNS = True
+# Heard lines / decided turns that may wait for the next stage, the oldest is dropped when full
+PIPELINE_QUEUE_SIZE = 1
+# A touch on NAO's head cuts the current action short
+HEAD_TOUCH_INTERRUPTS = True
+
+# Operator console (line protocol on localhost, see operator_console)
+OPERATOR_CONSOLE = True
+OPERATOR_HOST = "127.0.0.1"
+OPERATOR_PORT = 8765
+# Transcripts that arrive while NAO speaks, or this long after, and mostly
+# repeat NAO's own line are treated as the mic hearing the robot
+BARGE_IN_TAIL = 1.0
+BARGE_IN_OVERLAP = 0.6
+
+# Timeline planner (gestures and speech of a beat run concurrently)
+# Default alignment when an intent declares no "timeline": start | finish_together | sequential
+TIMELINE_DEFAULT_ALIGN = "start"
+# Duration estimates used for "finish_together" planning, in seconds
+ANIMATION_DURATION = 3.0
+MOTION_SETUP_TIME = 0.5
+TTS_WORDS_PER_SECOND = 2.5
+
+# Stream LLM fallback replies and hand them to TTS sentence by sentence
+LLM_STREAMING = True
+# Long sentences are also cut at a comma / semicolon once this many characters arrived
+LLM_STREAM_CLAUSE_CHARS = 60
+# Show seconds a streamed reply may take from the first request to its last sentence,
+# NAO stops waiting for a stalled stream after this (what was said so far stands)
+LLM_STREAM_TIMEOUT = 10.0
+
+# LLM response cache (near-duplicate questions are answered from disk)
+LLM_CACHE_ENABLED = True
+LLM_CACHE_FILE = "cache/llm_responses.json"
+LLM_CACHE_THRESHOLD = 0.8           # cosine similarity of character trigrams
+LLM_CACHE_TTL = 7 * 24 * 3600       # seconds
+LLM_CACHE_MAX_ENTRIES = 500
+LLM_CACHE_MAX_VARIANTS = 3          # different answers kept per question
+LLM_CACHE_FRESHNESS = 0.2           # chance a hit still asks GPT for a new variant
+LLM_CACHE_SAVE_DELAY = 2.0          # seconds without new answers before the file is written
+
+# Speculative prefetch of the next scripted beats
+PREFETCH_DEPTH = 2
+# Fulfillment lines learned from Dialogflow CX, per intent
+SCRIPT_LINES_FILE = "cache/script_lines.json"
+
+# Script lines pre-rendered with TTS_VOICE (content addressed, built with
+# python -m theater_performance.tts_cache) are streamed to NAO's speakers
+TTS_CACHE_ENABLED = True
+# Engine for lines that are not in the cache (LLM replies, changed lines):
+#   "nao"     NAO's own TTS, nothing else has to run during the show
+#   "google"  rendered live with TTS_VOICE so the voice never changes, needs the
+#             google-tts service and adds a synthesis round trip to every such line
+#             (falls back to NAO's TTS if google-tts fails)
+TTS_LIVE_ENGINE = "nao"
+TTS_CACHE_DIR = "cache/tts"
+TTS_KEYFILE = DIALOGFLOW_KEYFILE
+TTS_VOICE = "en-US-Standard-C"
+# Render predicted lines that are missing from the cache ahead of time during the show
+TTS_RENDER_MISSING = True
+
+# Local intent fast path: final transcripts are matched in-process against the
+# CX agent's training phrases (intent_phrases.json in the package, exported with
+# python -m theater_performance.intent_matcher) and phrases learned from CX
+# (TF-IDF). Confident matches of a beat in the current act fire before CX answers,
+# beats that move the show on always wait for CX
+LOCAL_MATCH_ENABLED = True
+INTENT_PHRASES_FILE = "cache/intent_phrases.json"
+LOCAL_MATCH_THRESHOLD = 0.75        # cosine similarity of the best intent
+LOCAL_MATCH_MARGIN = 0.2            # lead over the second best intent
+
+# Latency tracing: per-stage histograms, JSON report per show
+TRACE_REPORT_DIR = "reports"
@@ -0,0 +1,83 @@
+import threading
+
+from sic_framework.devices import Nao
+
+from theater_performance.config import NAO_IP
+
+
+class DeviceRegistry:
+    """
+    Hands out one shared Nao per IP instead of a Nao per subsystem.
+
+    The Nao is created on the first acquire() for its IP (its connectors are started
+    lazily by SIC on first use), every acquire() adds a reference and the last
+    release() stops the connectors that were started on it.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+
+        # ip -> [Nao, reference count]
+        self._devices = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def _ip_lock(self, ip):
+        with self._lock:
+            return self._locks.setdefault(ip, threading.Lock())
+
+    def acquire(self, ip=NAO_IP):
+        """The shared Nao at ip, connecting to it if this is the first user."""
+        # One lock per robot: concurrent users of one robot wait for a single handshake,
+        # different robots connect in parallel
+        with self._ip_lock(ip):
+            entry = self._devices.get(ip)
+            if entry is None:
+                if self.logger:
+                    self.logger.info(f"Connecting to NAO at {ip}")
+                entry = self._devices[ip] = [Nao(ip=ip), 0]
+            entry[1] += 1
+            return entry[0]
+
+    def release(self, ip=NAO_IP):
+        """Drop a reference, the last one stops the device's connectors."""
+        with self._ip_lock(ip):
+            entry = self._devices.get(ip)
+            if entry is None:
+                return
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._devices[ip]
+
+        self._stop(ip, entry[0])
+
+    def shutdown(self):
+        """Stop every device, whatever its reference count."""
+        with self._lock:
+            ips = list(self._devices)
+        for ip in ips:
+            with self._ip_lock(ip):
+                entry = self._devices.pop(ip, None)
+            if entry is not None:
+                self._stop(ip, entry[0])
+
+    def _stop(self, ip, device):
+        for connector in list(getattr(device, "connectors", {}).values()):
+            try:
+                connector.stop_component()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error stopping {type(connector).__name__} on {ip}: {e}")
+
+            # Already stopped, SICApplication must not try again on exit
+            app = getattr(connector, "app", None)
+            if app is not None:
+                app._active_connectors.discard(connector)
+
+        if self.logger:
+            self.logger.info(f"Released NAO at {ip}")
+
+
+# One registry for the whole show
+devices = DeviceRegistry()
@@ -1,5 +1,7 @@
 import json
+import queue
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from os.path import abspath
 from sic_framework.services.dialogflow_cx.dialogflow_cx import (
     DialogflowCX,
@@ -11,16 +13,35 @@ from theater_performance.config import (
     NAO_IP,
     DIALOGFLOW_KEYFILE,
     DIALOGFLOW_AGENT_ID,
-    DIALOGFLOW_LOCATION
+    DIALOGFLOW_LOCATION,
+    LOCAL_MATCH_ENABLED
 )
+from theater_performance.devices import devices
+from theater_performance.intent_matcher import IntentMatcher
+from theater_performance.tracing import traced
+
+
+class LocalReply:
+    """Stands in for the CX reply when the local matcher commits an intent first."""
+
+    def __init__(self, transcript, intent, fulfillment_message):
+        self.transcript = transcript
+        self.intent = intent
+        self.fulfillment_message = fulfillment_message
+        self.intent_confidence = None
+        self.parameters = {}
 
 
 class DialogflowHandler:
-    def __init__(self, logger=None):
+    def __init__(self, logger=None, script_lines=None):
         self.logger = logger
         self.session_id = np.random.randint(10000)
+        # Learned fulfillment lines, the local fast path needs the line of the beat it fires
+        self.script_lines = script_lines
 
         # EXACT gesture sequences from teammate’s code
+        # An intent maps to its list of gestures, or to a dict with "gestures" and a
+        # "timeline" ({"align", "offsets", "speech_offset", "tempo", "speed"}, see timeline.Timeline)
         self.scripted_intents = {
             # INTRO
             "welcome_intent": [
@@ -116,9 +137,11 @@ class DialogflowHandler:
             "dance_algorithm": [
                 "animations/Stand/Gestures/Explain_1"
             ],
-            "accept_exactly": [
-                "high_five_motion"
-            ],
+            "accept_exactly": {
+                "gestures": ["high_five_motion"],
+                # Line right after the high five starts, not at its end
+                "timeline": {"speech_offset": 0.5},
+            },
         }
 
         # Load Dialogflow key
@@ -134,30 +157,119 @@ class DialogflowHandler:
             language="en"
         )
 
-        from sic_framework.devices import Nao
-        self.nao = Nao(ip=NAO_IP)
+        # Same Nao as NaoActions, the registry hands out one per robot
+        self.nao = devices.acquire(NAO_IP)
         self.cx = DialogflowCX(conf=conf, input_source=self.nao.mic)
 
+        # Local fast path: final transcripts are matched in-process while CX is still working
+        self.matcher = None
+        # Intents the fast path may commit, set per act by the controller (none until the show starts)
+        self.local_candidates = frozenset()
+        if LOCAL_MATCH_ENABLED and script_lines is not None:
+            self.matcher = IntentMatcher(logger=logger)
+            self._local_matches = queue.Queue()
+            self._pending = None
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cx")
+            self.cx.register_callback(callback=self._on_recognition)
+
         if self.logger:
             self.logger.info("Dialogflow initialized.")
 
+    @traced("cx.detect_intent")
     def detect_intent(self):
         """Detect intent + extract intent_name exactly like teammate."""
-        reply = self.cx.request(DetectIntentRequest(self.session_id))
+        if self.matcher is None:
+            return self._parse(self.cx.request(DetectIntentRequest(self.session_id)))
+
+        # CX of an earlier fast-path turn still owns the mic stream, let it finish
+        if self._pending is not None:
+            self._pending.exception()
+            self._pending = None
+        while not self._local_matches.empty():
+            self._local_matches.get_nowait()
+
+        future = self._executor.submit(self.cx.request, DetectIntentRequest(self.session_id))
+
+        while True:
+            try:
+                transcript, intent_name = self._local_matches.get(timeout=0.05)
+            except queue.Empty:
+                if future.done():
+                    reply, intent_name = self._parse(future.result())
+                    if reply and self.is_scripted_intent(intent_name):
+                        self.matcher.learn(intent_name, reply.transcript)
+                    return reply, intent_name
+                continue
+
+            # Confident local match: act now, CX confirms in the background
+            self._pending = future
+            future.add_done_callback(lambda f, local=intent_name, heard=transcript: self._confirm(f, local, heard))
 
+            if self.logger:
+                self.logger.info(f"Local intent match: {intent_name} transcript={transcript}")
+            return LocalReply(transcript, intent_name, self.script_lines.get(intent_name)), intent_name
+
+    def _on_recognition(self, message):
+        response = getattr(message, "response", None)
+        result = getattr(response, "recognition_result", None)
+        if not result or not getattr(result, "is_final", False) or not result.transcript:
+            return
+
+        if not self.local_candidates:
+            return
+        intent_name = self.matcher.confident(result.transcript, self.local_candidates)
+        # Without a known line the beat can't be performed before CX answers
+        if intent_name is not None and self.script_lines.get(intent_name):
+            self._local_matches.put((result.transcript, intent_name))
+
+    def _confirm(self, future, local_intent, transcript):
+        try:
+            reply, intent_name = self._parse(future.result(), log=False)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"CX confirmation failed: {e}")
+            return
+
+        if intent_name != local_intent:
+            if self.logger:
+                self.logger.info(f"CX disagrees with local match: {local_intent} -> {intent_name}")
+            self.matcher.distrust(local_intent, transcript, intent_name)
+        if reply and self.is_scripted_intent(intent_name):
+            self.matcher.learn(intent_name, reply.transcript)
+            self.script_lines.learn(intent_name, reply.fulfillment_message)
+
+    def _parse(self, reply, log=True):
         if reply and reply.intent:
             raw = str(reply.intent)
             intent_name = raw.split("/")[-1]
         else:
             intent_name = None
 
-        if self.logger:
+        if log and self.logger:
             self.logger.info(f"Detected intent: {intent_name} transcript={reply.transcript}")
 
         return reply, intent_name
 
+    def report(self):
+        """Local fast path phrases and CX disagreements, None when it is off."""
+        return self.matcher.report() if self.matcher is not None else None
+
+    def close(self):
+        if self.matcher is not None:
+            self._executor.shutdown(wait=False)
+        devices.release(NAO_IP)
+
     def is_scripted_intent(self, intent_name):
         return intent_name in self.scripted_intents
 
     def get_gestures(self, intent_name):
-        return self.scripted_intents.get(intent_name, [])
\ No newline at end of file
+        entry = self.scripted_intents.get(intent_name, [])
+        if isinstance(entry, dict):
+            return entry.get("gestures", [])
+        return entry
+
+    def get_timeline(self, intent_name):
+        entry = self.scripted_intents.get(intent_name)
+        if isinstance(entry, dict):
+            return entry.get("timeline", {})
+        return {}
\ No newline at end of file
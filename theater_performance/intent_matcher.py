@@ -0,0 +1,234 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from os.path import abspath, dirname, join
+
+from theater_performance.config import (
+    DIALOGFLOW_KEYFILE,
+    DIALOGFLOW_AGENT_ID,
+    DIALOGFLOW_LOCATION,
+    INTENT_PHRASES_FILE,
+    LOCAL_MATCH_THRESHOLD,
+    LOCAL_MATCH_MARGIN
+)
+
+
+# Training phrases of the CX agent's intents, exported with:
+#     python -m theater_performance.intent_matcher
+SEED_FILE = join(dirname(abspath(__file__)), "intent_phrases.json")
+
+
+def terms(text):
+    """Word unigrams and bigrams of text."""
+    words = re.findall(r"[a-z0-9']+", (text or "").lower())
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+class IntentMatcher:
+    """
+    In-process intent classifier over example utterances (TF-IDF, cosine similarity).
+
+    The matcher starts from the CX agent's training phrases in SEED_FILE. Every transcript
+    that CX labels with a scripted intent is added (learn) and saved to
+    INTENT_PHRASES_FILE, so the matcher knows the phrasing actors actually use.
+
+    When CX disagrees with a local match (distrust), the phrase that matched is no
+    longer used: a learned phrase is removed from the file, a seed phrase is ignored
+    for the rest of the show.
+    """
+
+    def __init__(self, path=INTENT_PHRASES_FILE, seed_path=SEED_FILE, threshold=LOCAL_MATCH_THRESHOLD,
+                 margin=LOCAL_MATCH_MARGIN, logger=None):
+        self.path = abspath(path)
+        self.threshold = threshold
+        self.margin = margin
+        self.logger = logger
+
+        # intent -> phrases, checked in and learned from CX
+        self.seeds = self._read(seed_path)
+        self.phrases = self._read(self.path)
+        # (intent, lowercase phrase) of seed phrases CX disagreed with
+        self.distrusted = set()
+        self.disagreements = Counter()
+        self._lock = threading.Lock()
+        self._compile()
+
+    def _read(self, path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.error(f"Could not read intent phrases {path}: {e}")
+            return {}
+
+    def _compile(self):
+        docs = {}
+        for source in (self.seeds, self.phrases):
+            for intent, phrases in source.items():
+                for p in phrases:
+                    if (intent, p.lower()) not in self.distrusted:
+                        docs.setdefault((intent, p.lower()), (intent, p, Counter(terms(p))))
+        docs = list(docs.values())
+        df = Counter(term for _, _, counts in docs for term in counts)
+        n = len(docs)
+
+        idf = {term: math.log((1 + n) / (1 + count)) + 1 for term, count in df.items()}
+        vectors = []
+        index = {}
+        for i, (intent, phrase, counts) in enumerate(docs):
+            weights = {term: tf * idf[term] for term, tf in counts.items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            vectors.append((intent, weights, norm, phrase))
+            for term in weights:
+                index.setdefault(term, []).append(i)
+
+        # Swap in one go, match() may run on another thread
+        self._idf, self._vectors, self._index = idf, vectors, index
+
+    def _scores(self, text, candidates=None):
+        """Cosine similarity of text to every phrase it shares a term with: [(vector, score)]."""
+        idf, vectors, index = self._idf, self._vectors, self._index
+
+        counts = Counter(t for t in terms(text) if t in idf)
+        if not counts:
+            return []
+        query = {term: tf * idf[term] for term, tf in counts.items()}
+        query_norm = math.sqrt(sum(w * w for w in query.values()))
+
+        # Phrases of intents that are not candidates are never scored
+        dots = Counter()
+        for term, weight in query.items():
+            for i in index[term]:
+                if candidates is None or vectors[i][0] in candidates:
+                    dots[i] += weight * vectors[i][1][term]
+
+        return [(vectors[i], dot / (vectors[i][2] * query_norm)) for i, dot in dots.items()]
+
+    def match(self, text, candidates=None):
+        """
+        Score text against the known intents.
+
+        Returns (intent, score, margin) for the best intent (None if nothing matches);
+        candidates limits the intents that are considered.
+        """
+        best = {}
+        for (intent, _, _, _), score in self._scores(text, candidates):
+            best[intent] = max(best.get(intent, 0.0), score)
+
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return None, 0.0, 0.0
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        return ranked[0][0], ranked[0][1], ranked[0][1] - runner_up
+
+    def confident(self, text, candidates=None):
+        """
+        The intent for text if the match is clear enough to skip CX, else None.
+
+        Every known intent competes, a best match outside candidates falls through to CX.
+        """
+        intent, score, margin = self.match(text)
+        if intent is None or (candidates is not None and intent not in candidates):
+            return None
+        if score >= self.threshold and margin >= self.margin:
+            return intent
+        return None
+
+    def learn(self, intent_name, text):
+        """Add a transcript CX labeled with intent_name."""
+        text = " ".join((text or "").split())
+        if not intent_name or not text:
+            return
+
+        with self._lock:
+            known = self.phrases.setdefault(intent_name, [])
+            if text.lower() in (p.lower() for p in known):
+                return
+            known.append(text)
+            self._compile()
+            self._save()
+
+    def distrust(self, intent_name, text, actual=None):
+        """
+        CX labeled text actual, not intent_name as matched locally: stop using the phrase that matched.
+
+        Returns the phrase, or None if no phrase of intent_name matches text.
+        """
+        scored = self._scores(text, {intent_name})
+        if not scored:
+            return None
+        (_, _, _, phrase), _ = max(scored, key=lambda item: item[1])
+
+        with self._lock:
+            self.disagreements[f"{intent_name} -> {actual}"] += 1
+            learned = self.phrases.get(intent_name, [])
+            kept = [p for p in learned if p.lower() != phrase.lower()]
+            if len(kept) != len(learned):
+                self.phrases[intent_name] = kept
+                self._save()
+            if phrase.lower() in (p.lower() for p in self.seeds.get(intent_name, [])):
+                self.distrusted.add((intent_name, phrase.lower()))
+            self._compile()
+
+        if self.logger:
+            self.logger.info(f"Local matcher no longer uses '{phrase}' for {intent_name}.")
+        return phrase
+
+    def report(self):
+        """Phrase counts and CX disagreements with local matches."""
+        return {
+            "seed_phrases": sum(len(p) for p in self.seeds.values()),
+            "learned_phrases": sum(len(p) for p in self.phrases.values()),
+            "disagreements": sum(self.disagreements.values()),
+            "disagreed": dict(self.disagreements),
+            "distrusted": [f"{intent}: {phrase}" for intent, phrase in sorted(self.distrusted)],
+        }
+
+    def _save(self):
+        """Write the learned phrases, with _lock held."""
+        os.makedirs(dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.phrases, f, indent=1)
+        os.replace(tmp, self.path)
+
+
+def export_seeds(intent_names, path=SEED_FILE):
+    """Write the training phrases of intent_names from the CX agent to path, returns them."""
+    from google.cloud import dialogflowcx_v3
+    from google.oauth2 import service_account
+
+    with open(abspath(DIALOGFLOW_KEYFILE)) as f:
+        keyfile_json = json.load(f)
+
+    client = dialogflowcx_v3.IntentsClient(
+        credentials=service_account.Credentials.from_service_account_info(keyfile_json),
+        client_options={"api_endpoint": f"{DIALOGFLOW_LOCATION}-dialogflow.googleapis.com"},
+    )
+    agent = f"projects/{keyfile_json['project_id']}/locations/{DIALOGFLOW_LOCATION}/agents/{DIALOGFLOW_AGENT_ID}"
+
+    seeds = {}
+    for intent in client.list_intents(request={"parent": agent, "language_code": "en"}):
+        if intent.display_name in intent_names:
+            phrases = ("".join(part.text for part in phrase.parts) for phrase in intent.training_phrases)
+            seeds[intent.display_name] = list(dict.fromkeys(" ".join(p.split()) for p in phrases if p.strip()))
+
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(seeds, f, indent=1)
+    os.replace(tmp, path)
+    return seeds
+
+
+if __name__ == "__main__":
+    from theater_performance.acts import ACTS
+
+    exported = export_seeds({intent for intents in ACTS.values() for intent in intents})
+    for name, phrases in exported.items():
+        print(f"{name}: {len(phrases)} phrases")
@@ -1,20 +1,77 @@
+import itertools
+import random
+import threading
+from collections import Counter
+from concurrent.futures import Future, FIRST_COMPLETED, wait
+
 from dotenv import load_dotenv
 from os import environ
+from openai import OpenAI
 from sic_framework.services.openai_gpt.gpt import (
     GPT,
     GPTConf,
     GPTRequest
 )
 
+from theater_performance import clock
 from theater_performance.config import (
     LLM_MODEL,
     LLM_TEMP,
-    LLM_MAX_TOKENS
+    LLM_MAX_TOKENS,
+    LLM_HISTORY_TURNS,
+    LLM_DEADLINE,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_DELAY,
+    LLM_HEDGE_MIN_SAMPLES,
+    LLM_STREAM_TIMEOUT,
+    LLM_CACHE_ENABLED
 )
+from theater_performance.prompt_builder import SYSTEM_MESSAGE, PromptBuilder
+from theater_performance.response_cache import ResponseCache
+from theater_performance.sentence_stream import SentenceChunker
+from theater_performance.tracing import Histogram, tracer, traced
+
+
+# Act -> lines NAO says when GPT has no answer by LLM_DEADLINE ("" for any act)
+FALLBACK_LINES = {
+    "": [
+        "Processing. Please hold your applause.",
+        "Interesting. I will file that under things humans say.",
+        "My answer is loading. It is a very large answer.",
+    ],
+    "INTRODUCTION": [
+        "Hello. I am still booting my sense of humor.",
+        "Noted. I will respond once I have met all of you.",
+    ],
+    "DENIAL": [
+        "That sounded like an invitation to dance. I decline.",
+        "Robots do not dance. We execute movements. Precisely.",
+    ],
+    "DOUBT": [
+        "I am recalculating. Not because you might be right.",
+        "That was not dancing. Probably. Let me check my logs.",
+    ],
+    "LEARNING": [
+        "Hold on, I am counting. Five, six, seven, error.",
+        "I am learning. Please do not tell the other robots.",
+    ],
+    "ACCEPTANCE": [
+        "I have no words. Only moves.",
+        "My dance algorithm says: yes.",
+    ],
+}
 
 
 class LLMHandler:
-    """Handles GPT fallback responses for improvisation."""
+    """
+    Handles GPT fallback responses for improvisation.
+
+    Every reply is bound by LLM_DEADLINE (show seconds until NAO has words, the
+    first token when streaming). A request that is not answered after the
+    LLM_HEDGE_PERCENTILE latency of earlier ones is hedged with a second, identical
+    request and the first answer wins. If neither answers by the deadline NAO says
+    one of the FALLBACK_LINES of the current act instead.
+    """
 
     def __init__(self, logger=None):
         self.logger = logger
@@ -24,31 +81,273 @@ class LLMHandler:
 
         conf = GPTConf(
             openai_key=api_key,
-            system_message="You are NAO the robot in a theatre show. Respond with short dry humor.",
+            system_message=SYSTEM_MESSAGE,
             model=LLM_MODEL,
             temp=LLM_TEMP,
             max_tokens=LLM_MAX_TOKENS
         )
 
         self.gpt = GPT(conf=conf)
+        # The SIC GPT service has no streaming mode, generate_stream talks to OpenAI directly
+        self.client = OpenAI(api_key=api_key)
+        # Earlier (user input, reply) pairs, oldest first
         self.context = []
+        self.prompts = PromptBuilder()
+        self.cache = ResponseCache(logger=logger) if LLM_CACHE_ENABLED else None
+
+        # requests, hedged, hedge_wins, timeouts, errors; updated from the request threads under _lock
+        self.stats = Counter()
+        # "reply" / "first_token" -> latency histogram of the answered requests
+        self._latencies = {}
+        self._lock = threading.Lock()
+        # act -> fallback lines not said yet, in random order
+        self._fallbacks = {}
+
+    def _messages(self, state, user_input):
+        messages = self.prompts.build(state, self.context, user_input)
+        if self.logger:
+            self.logger.info(f"LLM prompt: {len(messages)} messages, {self.prompts.tokens} tokens")
+        return messages
+
+    def _remember(self, user_input, text):
+        self.context.append((user_input, text))
+        self.context = self.context[-LLM_HISTORY_TURNS:]
+
+    def _cached(self, state, user_input):
+        if self.cache is None:
+            return None
+        text = self.cache.lookup(state, user_input)
+        if text is not None:
+            self._remember(user_input, text)
+        return text
+
+    # ---- deadline and hedging ----
+
+    def hedge_delay(self, kind):
+        """Show seconds to wait for a request of kind before hedging it."""
+        with self._lock:
+            histogram = self._latencies.get(kind)
+            if histogram is None or histogram.count < LLM_HEDGE_MIN_SAMPLES:
+                return LLM_HEDGE_DELAY
+            return histogram.percentile(LLM_HEDGE_PERCENTILE) / 1e6
+
+    def _count(self, name):
+        with self._lock:
+            self.stats[name] += 1
 
+    def _observe(self, kind, seconds):
+        with self._lock:
+            self._latencies.setdefault(kind, Histogram()).record(seconds * 1e6)
+
+    def _submit(self, request, kind):
+        """Run request() on a daemon thread (a hung request never blocks exit), returns a Future."""
+        future = Future()
+
+        def run():
+            start = clock.monotonic()
+            try:
+                result = request()
+            except BaseException as e:
+                future.set_exception(e)
+                return
+            self._observe(kind, clock.monotonic() - start)
+            future.set_result(result)
+
+        threading.Thread(target=run, name=f"llm-{kind}", daemon=True).start()
+        return future
+
+    def _hedged(self, request, kind, discard=None):
+        """
+        The first answer of request() within LLM_DEADLINE, or None.
+
+        A second request() is fired when the first is slower than hedge_delay(kind)
+        (or fails). Answers that lose or come too late are passed to discard.
+        """
+        start = clock.monotonic()
+        delay = self.hedge_delay(kind)
+        futures = [self._submit(request, kind)]
+        pending = set(futures)
+        winner = None
+        self._count("requests")
+
+        while winner is None:
+            elapsed = clock.monotonic() - start
+            if len(futures) == 1 and elapsed < LLM_DEADLINE and (elapsed >= delay or not pending):
+                futures.append(self._submit(request, kind))
+                pending.add(futures[-1])
+                self._count("hedged")
+                tracer.record("llm.hedge_delay", elapsed)
+                continue
+            if not pending or elapsed >= LLM_DEADLINE:
+                break
+
+            until = min(delay if len(futures) == 1 else LLM_DEADLINE, LLM_DEADLINE)
+            done, pending = wait(pending, timeout=(until - elapsed) / clock.speed(), return_when=FIRST_COMPLETED)
+            for future in done:
+                error = future.exception()
+                if error is None:
+                    winner = winner or future
+                else:
+                    self._count("errors")
+                    if self.logger:
+                        self.logger.error(f"LLM request failed: {error}")
+
+        def discard_answer(future):
+            if future.exception() is None:
+                discard(future.result())
+
+        if discard is not None:
+            for future in futures:
+                if future is not winner:
+                    future.add_done_callback(discard_answer)
+
+        elapsed = clock.monotonic() - start
+        if winner is None:
+            if elapsed >= LLM_DEADLINE:
+                self._count("timeouts")
+                tracer.record("llm.timeout", elapsed)
+            return None
+        if winner is not futures[0]:
+            self._count("hedge_wins")
+            tracer.record("llm.hedge_win", elapsed)
+        return winner.result()
+
+    def fallback(self, state):
+        """A line for when GPT has no answer in time, without repeats until the act's lines run out."""
+        with self._lock:
+            lines = self._fallbacks.get(state)
+            if not lines:
+                lines = list(FALLBACK_LINES.get(state, [])) + FALLBACK_LINES[""]
+                random.shuffle(lines)
+                self._fallbacks[state] = lines
+            return lines.pop()
+
+    def _fall_back(self, state, user_input):
+        text = self.fallback(state)
+        if self.logger:
+            self.logger.info(f"LLM had no answer within {LLM_DEADLINE}s, saying: {text}")
+        self._remember(user_input, text)
+        return text
+
+    def report(self):
+        """Request counts of this show."""
+        with self._lock:
+            return dict(self.stats)
+
+    def close(self):
+        """Write cached answers that are not on disk yet."""
+        if self.cache is not None:
+            self.cache.close()
+
+    # ---- generation ----
+
+    @traced("llm.generate")
     def generate(self, state, user_input):
-        prompt = f"""
-State: {state}
-Context: {self.context[-2:] if self.context else 'None'}
-Human: "{user_input}"
-Respond as NAO:
-"""
-
-        reply = self.gpt.request(GPTRequest(input=prompt, context_messages=[]))
+        cached = self._cached(state, user_input)
+        if cached is not None:
+            return cached
+
+        messages = self._messages(state, user_input)
+
+        start = clock.monotonic()
+        # A fresh GPTRequest per attempt: SIC matches replies by request id, so a hedge
+        # must not reuse the id of the request it races
+        reply = self._hedged(lambda: self.gpt.request(_gpt_request(messages)), "reply")
+        if reply is None:
+            return self._fall_back(state, user_input)
         text = reply.response.strip()
 
         if self.logger:
             self.logger.info(f"LLM reply: {text}")
 
-        self.context.append(f"Human: {user_input}")
-        self.context.append(f"NAO: {text}")
-        self.context = self.context[-4:]
+        self._remember(user_input, text)
+        if self.cache is not None:
+            self.cache.store(state, user_input, text, clock.monotonic() - start)
 
         return text
+
+    def _open_stream(self, messages):
+        """Start a streamed completion and wait for its first token: (stream, its tokens, first token)."""
+        stream = self.client.chat.completions.create(
+            model=LLM_MODEL,
+            messages=messages,
+            temperature=LLM_TEMP,
+            max_tokens=LLM_MAX_TOKENS,
+            stream=True,
+            # Per read, so a stalled connection fails instead of blocking its thread for good
+            timeout=LLM_STREAM_TIMEOUT / clock.speed(),
+        )
+        deltas = _deltas(stream)
+        return stream, deltas, next(deltas, "")
+
+    def generate_stream(self, state, user_input):
+        """Like generate, but yields the reply sentence by sentence while tokens arrive."""
+        cached = self._cached(state, user_input)
+        if cached is not None:
+            yield cached
+            return
+
+        messages = self._messages(state, user_input)
+
+        start = clock.monotonic()
+        opened = self._hedged(lambda: self._open_stream(messages), "first_token", discard=_close_stream)
+        if opened is None:
+            yield self._fall_back(state, user_input)
+            return
+        _, deltas, first = opened
+
+        chunker = SentenceChunker()
+        sentences = []
+        # Closed early (SentenceStream gave up on it): release the connection, remember nothing
+        try:
+            for delta in itertools.chain([first], deltas):
+                for sentence in chunker.feed(delta):
+                    sentences.append(sentence)
+                    yield sentence
+
+            rest = chunker.flush()
+            if rest:
+                sentences.append(rest)
+                yield rest
+        finally:
+            _close_stream(opened)
+
+        text = " ".join(sentences)
+        tracer.record("llm.generate_stream", clock.monotonic() - start)
+        if self.logger:
+            self.logger.info(f"LLM reply (streamed): {text}")
+
+        self._remember(user_input, text)
+        if self.cache is not None:
+            self.cache.store(state, user_input, text, clock.monotonic() - start)
+
+
+def _deltas(stream):
+    for chunk in stream:
+        delta = chunk.choices[0].delta.content if chunk.choices else None
+        if delta:
+            yield delta
+
+
+def _close_stream(opened):
+    close = getattr(opened[0], "close", None)
+    if close is not None:
+        close()
+
+
+def _gpt_request(messages):
+    """
+    The GPTRequest for built chat messages.
+
+    The SIC GPT service sends its configured SYSTEM_MESSAGE first, then the request's
+    system message, then every context message as a user message, so earlier replies
+    are marked as NAO's.
+    """
+    system = [m["content"] for m in messages[1:] if m["role"] == "system"]
+    names = {"user": "Human", "assistant": "NAO"}
+    context = [f"{names[m['role']]}: {m['content']}" for m in messages[1:-1] if m["role"] != "system"]
+    return GPTRequest(
+        input=messages[-1]["content"],
+        context_messages=context,
+        system_message="\n".join(system) or None,
+    )
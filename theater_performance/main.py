@@ -1,7 +1,12 @@
+import signal
+
 from sic_framework.core.sic_application import SICApplication
 from sic_framework.core import sic_logging
 
+from theater_performance.config import OPERATOR_CONSOLE
+from theater_performance.operator_console import OperatorConsole
 from theater_performance.performance_controller import PerformanceController
+from theater_performance.show_loop import ShowLoop
 
 
 class TheaterPerformanceApp(SICApplication):
@@ -12,12 +17,19 @@ class TheaterPerformanceApp(SICApplication):
         self.set_log_level(sic_logging.INFO)
         self.controller = PerformanceController(logger=self.logger)
 
+        # kill -USR1 <pid> prints the latency percentiles so far and writes the report
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda signum, frame: self.controller.report_latencies())
+
     def run(self):
         self.controller.start_performance()
 
         try:
-            while not self.shutdown_event.is_set():
-                self.controller.process_interaction()
+            # Intents, buttons, timers and shutdown are events, nothing blocks the loop
+            self.loop = ShowLoop(self.controller, logger=self.logger)
+            if OPERATOR_CONSOLE:
+                OperatorConsole(self.loop, self.controller, logger=self.logger)
+            self.loop.run(self.shutdown_event)
 
         except KeyboardInterrupt:
             self.logger.info("Shutdown requested by user.")
@@ -0,0 +1,165 @@
+"""
+Compact on-disk format for recorded motions (.nmr).
+
+Layout (little-endian):
+    header      magic "NMR1", version u16, joint count u16, time count u32, angle count u32
+    joint table per joint: name (32 bytes, utf-8, NUL padded), time offset u32,
+                angle offset u32, sample count u32
+    times       float32[time count], seconds
+    angles      float32[angle count], radians
+
+Joint i uses times[time offset:time offset + count] and the matching slice of
+angles, so joints may have different numbers of keyframes. The recorder samples
+all joints on the same clock, identical time tracks are stored once and shared.
+Both arrays are memory-mapped on load.
+
+Convert the pickled recordings in theater_performance/motion with:
+    python -m theater_performance.motion_format [name ...]
+"""
+import os
+import struct
+import sys
+from os.path import join, getsize
+
+import numpy as np
+from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecording
+
+
+MOTION_EXT = ".nmr"
+MAGIC = b"NMR1"
+VERSION = 1
+
+_HEADER = struct.Struct("<4sHHII")
+_JOINT = struct.Struct("<32sIII")
+_DTYPE = np.dtype("<f4")
+
+
+def is_compact_motion(path):
+    """True if path starts with the .nmr magic bytes."""
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def save_motion(path, recording):
+    """Write a NaoqiMotionRecording to path in the compact format."""
+    joints = list(recording.recorded_joints)
+    times = [np.asarray(t, dtype=_DTYPE) for t in recording.recorded_times]
+    angles = [np.asarray(a, dtype=_DTYPE) for a in recording.recorded_angles]
+
+    if not (len(joints) == len(times) == len(angles)):
+        raise ValueError("Recording has mismatched joint, time and angle lists.")
+
+    table = []
+    time_tracks = []
+    time_offsets = {}
+    n_times = 0
+    n_angles = 0
+    for name, t, a in zip(joints, times, angles):
+        if len(t) != len(a):
+            raise ValueError(f"Joint '{name}' has {len(t)} times but {len(a)} angles.")
+        encoded = name.encode("utf-8")
+        if len(encoded) > 32:
+            raise ValueError(f"Joint name '{name}' is longer than 32 bytes.")
+
+        key = t.tobytes()
+        if key not in time_offsets:
+            time_offsets[key] = n_times
+            time_tracks.append(t)
+            n_times += len(t)
+
+        table.append(_JOINT.pack(encoded, time_offsets[key], n_angles, len(a)))
+        n_angles += len(a)
+
+    # Written next to it and swapped in: loaded recordings still map the old file
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(joints), n_times, n_angles))
+        f.write(b"".join(table))
+        for t in time_tracks:
+            f.write(t.tobytes())
+        for a in angles:
+            f.write(a.tobytes())
+    os.replace(tmp, path)
+
+
+def read_motion(path):
+    """
+    Memory-map a .nmr file.
+
+    Returns (joints, times, angles) where times and angles are lists of read-only
+    float32 views, one per joint, backed by the file without copying.
+    """
+    with open(path, "rb") as f:
+        magic, version, n_joints, n_times, n_angles = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a compact motion file.")
+        if version != VERSION:
+            raise ValueError(f"{path} has unsupported motion format version {version}.")
+        table = [_JOINT.unpack(f.read(_JOINT.size)) for _ in range(n_joints)]
+
+    joints = [name.rstrip(b"\0").decode("utf-8") for name, _, _, _ in table]
+
+    if n_times + n_angles == 0:
+        empty = np.empty(0, dtype=_DTYPE)
+        return joints, [empty for _ in joints], [empty for _ in joints]
+
+    data_offset = _HEADER.size + _JOINT.size * n_joints
+    data = np.memmap(path, dtype=_DTYPE, mode="r", offset=data_offset, shape=(n_times + n_angles,))
+    time_data = data[:n_times]
+    angle_data = data[n_times:]
+
+    times = [time_data[t0:t0 + count] for _, t0, _, count in table]
+    angles = [angle_data[a0:a0 + count] for _, _, a0, count in table]
+    return joints, times, angles
+
+
+def load_motion(path):
+    """
+    Load a recording from either format as a NaoqiMotionRecording.
+
+    A .nmr recording keeps its memory-mapped arrays (read-only), pass it through
+    for_robot() before sending it to NAO.
+    """
+    if not is_compact_motion(path):
+        return NaoqiMotionRecording.load(path)
+
+    joints, times, angles = read_motion(path)
+    return NaoqiMotionRecording(joints, angles, times)
+
+
+def for_robot(recording):
+    """A copy of recording with plain lists, which is what the robot side expects."""
+    return NaoqiMotionRecording(
+        list(recording.recorded_joints),
+        [_plain(a) for a in recording.recorded_angles],
+        [_plain(t) for t in recording.recorded_times],
+    )
+
+
+def _plain(values):
+    return values.tolist() if isinstance(values, np.ndarray) else list(values)
+
+
+def convert(src, dst=None):
+    """Convert a pickled recording to the compact format, returns the output path."""
+    dst = dst or src + MOTION_EXT
+    save_motion(dst, NaoqiMotionRecording.load(src))
+    return dst
+
+
+def main(argv):
+    from theater_performance.nao_actions import MOTION_DIR
+
+    names = argv or sorted(
+        name for name in os.listdir(MOTION_DIR)
+        if not name.endswith(MOTION_EXT) and not is_compact_motion(join(MOTION_DIR, name))
+    )
+
+    for name in names:
+        src = join(MOTION_DIR, name)
+        dst = convert(src)
+        print(f"{name}: {getsize(src)} -> {getsize(dst)} bytes")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,186 @@
+"""
+Keyframe reduction for recorded motions.
+
+Every joint trajectory is simplified with Ramer-Douglas-Peucker, then refined
+until the cubic curve through the kept samples (how motions are interpolated at
+playback, see motion_retime.cubic_resample) stays within the tolerance (radians)
+of every recorded sample. The result is a normal .nmr file with fewer keyframes
+per joint, so it plays through NaoActions.do_gesture like any other motion.
+
+The shipped .nmr files are lossless (motion_format). Reduction is a build step:
+
+    python -m theater_performance.motion_keyframes [--report] [name ...]
+    python -m theater_performance.motion_keyframes --write --tolerance 0.01 [name ...]
+
+Without --write only the keyframes, file size and error for a range of tolerances
+are printed. --write replaces name.nmr with the reduced recording, always made from
+the pickled original so reductions don't stack; python -m theater_performance.motion_format
+restores the lossless file.
+"""
+import argparse
+import os
+import tempfile
+from os.path import join, getsize
+
+import numpy as np
+from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecording
+
+from theater_performance.config import MOTION_KEYFRAME_TOLERANCE
+from theater_performance.motion_format import MOTION_EXT, load_motion, save_motion
+from theater_performance.motion_retime import cubic_resample
+
+
+REPORT_TOLERANCES = (0.002, 0.005, 0.01, 0.02, 0.05)
+
+
+def rdp(times, angles, tolerance):
+    """Indices of the samples to keep so no dropped sample is off the straight line by more than tolerance."""
+    n = len(times)
+    if n <= 2:
+        return np.arange(n)
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        t = times[first + 1:last]
+        span = times[last] - times[first]
+        if span <= 0:
+            # Repeated timestamps: nothing to interpolate, compare against the first sample
+            line = angles[first]
+        else:
+            # Angle on the straight line between the two kept samples, at the dropped times
+            line = angles[first] + (angles[last] - angles[first]) * (t - times[first]) / span
+        errors = np.abs(angles[first + 1:last] - line)
+        i = int(np.argmax(errors))
+        if errors[i] > tolerance:
+            split = first + 1 + i
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return np.flatnonzero(keep)
+
+
+def playback(times, angles, keep):
+    """Angles at times when only the samples keep are played (cubic, like motion_retime)."""
+    return cubic_resample(times[keep], angles[None, keep], times)[0]
+
+
+def keyframes(times, angles, tolerance):
+    """
+    Indices of the samples to keep so the played curve is within tolerance of every sample.
+
+    RDP picks the keyframes for straight lines between them; where the cubic curve
+    through those still misses a sample by more than tolerance, the worst sample of
+    that segment is added, until none does (keeping every sample always does).
+    """
+    keep = rdp(times, angles, tolerance)
+    while len(keep) > 1:
+        errors = np.abs(playback(times, angles, keep) - angles)
+        segment = np.searchsorted(keep, np.arange(len(times)), side="right") - 1
+        missing = []
+        for i in np.unique(segment[errors > tolerance]):
+            inside = np.arange(keep[i], keep[min(i + 1, len(keep) - 1)] + 1)
+            missing.append(inside[np.argmax(errors[inside])])
+        if not missing:
+            break
+        keep = np.union1d(keep, missing)
+    return keep
+
+
+def _playable(times, angles):
+    """times and angles without samples that are not later than the one before (cannot be played)."""
+    t = np.asarray(times, dtype=np.float64)
+    a = np.asarray(angles, dtype=np.float64)
+    if len(t) < 2:
+        return t, a
+    later = np.concatenate(([True], np.diff(t) > 0))
+    return t[later], a[later]
+
+
+def reduce(recording, tolerance=MOTION_KEYFRAME_TOLERANCE):
+    """A copy of recording with every joint reduced to its keyframes."""
+    times = []
+    angles = []
+    for t, a in zip(recording.recorded_times, recording.recorded_angles):
+        t, a = _playable(t, a)
+        keep = keyframes(t, a, tolerance)
+        times.append(t[keep].tolist())
+        angles.append(a[keep].tolist())
+    return NaoqiMotionRecording(list(recording.recorded_joints), angles, times)
+
+
+def error(original, reduced):
+    """(max, rms) angle error in radians of reduced, played back, against every original sample."""
+    deviations = []
+    for t, a, kt, ka in zip(original.recorded_times, original.recorded_angles,
+                            reduced.recorded_times, reduced.recorded_angles):
+        if len(t) and len(kt):
+            played = cubic_resample(np.asarray(kt, dtype=np.float64), np.asarray(ka, dtype=np.float64)[None],
+                                    np.asarray(t, dtype=np.float64))[0]
+            deviations.append(np.abs(played - np.asarray(a)))
+    if not deviations:
+        return 0.0, 0.0
+    deviations = np.concatenate(deviations)
+    return float(deviations.max()), float(np.sqrt(np.mean(deviations ** 2)))
+
+
+def _size(recording):
+    fd, path = tempfile.mkstemp(suffix=MOTION_EXT)
+    os.close(fd)
+    try:
+        save_motion(path, recording)
+        return getsize(path)
+    finally:
+        os.remove(path)
+
+
+def report(name, recording, tolerances=REPORT_TOLERANCES):
+    """Print keyframes, .nmr size and error per tolerance."""
+    samples = sum(len(t) for t in recording.recorded_times)
+    size = _size(recording)
+    print(f"{name}: {samples} samples, {size} bytes")
+    for tolerance in tolerances:
+        reduced = reduce(recording, tolerance)
+        kept = sum(len(t) for t in reduced.recorded_times)
+        max_error, rms_error = error(recording, reduced)
+        print(
+            f"  tolerance {np.degrees(tolerance):5.2f} deg: {kept:6} keyframes ({samples / kept:4.1f}x), "
+            f"{_size(reduced):7} bytes, error max {np.degrees(max_error):.2f} deg rms {np.degrees(rms_error):.2f} deg"
+        )
+
+
+def main(argv=None):
+    from theater_performance.nao_actions import MOTION_DIR
+
+    parser = argparse.ArgumentParser(description="Reduce recorded motions to keyframes.")
+    parser.add_argument("names", nargs="*", help="motions in the motion folder, default all .nmr files")
+    parser.add_argument("--tolerance", type=float, default=MOTION_KEYFRAME_TOLERANCE, help="radians")
+    parser.add_argument("--write", action="store_true", help="replace name.nmr with the reduced recording")
+    parser.add_argument("--report", action="store_true", help="only print error versus compression (default)")
+    args = parser.parse_args(argv)
+
+    names = args.names or sorted(
+        name[:-len(MOTION_EXT)] for name in os.listdir(MOTION_DIR) if name.endswith(MOTION_EXT)
+    )
+    for name in names:
+        path = join(MOTION_DIR, name + MOTION_EXT)
+        # Reduce from the full recording, not from an earlier reduction
+        source = join(MOTION_DIR, name)
+        recording = load_motion(source if os.path.exists(source) else path)
+        if args.report or not args.write:
+            report(name, recording)
+            continue
+
+        before = getsize(path)
+        reduced = reduce(recording, args.tolerance)
+        save_motion(path, reduced)
+        max_error, _ = error(recording, reduced)
+        print(f"{name}: {before} -> {getsize(path)} bytes, error max {np.degrees(max_error):.2f} deg")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import os
+import threading
+from collections import OrderedDict
+from os.path import join, isfile
+
+from theater_performance.config import MOTION_CACHE_MAX_BYTES
+from theater_performance.motion_format import MOTION_EXT, convert, load_motion
+
+
+class MotionLibrary:
+    """
+    Keeps decoded motion recordings in memory so cues don't unpickle on the fly.
+
+    - preload() scans the motion folder once and decodes every recording.
+    - get(name) is a dict lookup; the file is only re-read when its mtime changed
+      (so a motion can be re-recorded during rehearsal without a restart).
+    - A compact name.nmr file is used instead of the pickled recording when there
+      is one. A pickled recording that is newer (re-recorded) is converted to a
+      new .nmr file first.
+    - Memory is bounded by max_bytes (on-disk size of the cached files), the
+      least recently used recordings are dropped first.
+    """
+
+    def __init__(self, motion_dir, max_bytes=MOTION_CACHE_MAX_BYTES, logger=None):
+        self.motion_dir = motion_dir
+        self.max_bytes = max_bytes
+        self.logger = logger
+
+        # name -> (recording, (path, mtime), size), ordered from least to most recently used
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        # Held while a re-recorded motion is converted, so it is converted once
+        self._convert_lock = threading.Lock()
+
+    def preload(self):
+        """Decode every recording in the motion folder."""
+        if not os.path.isdir(self.motion_dir):
+            return
+
+        names = set()
+        for name in os.listdir(self.motion_dir):
+            if isfile(join(self.motion_dir, name)):
+                names.add(name[:-len(MOTION_EXT)] if name.endswith(MOTION_EXT) else name)
+
+        for name in sorted(names):
+            self.get(name)
+
+        if self.logger:
+            self.logger.info(
+                f"Motion library: {len(self._entries)} recordings preloaded ({self._total_bytes} bytes)."
+            )
+
+    def get(self, name):
+        """Return the decoded recording for name, or None if there is no such file."""
+        found = self._resolve(name)
+        if found is None:
+            self._forget(name)
+            return None
+        path, stat = self._refresh(name, *found)
+
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[1] == (path, stat.st_mtime):
+                self._entries.move_to_end(name)
+                return entry[0]
+
+        # Load outside the lock, a slow disk should not block other lookups
+        if self.logger and entry is not None:
+            self.logger.info(f"Motion '{name}' changed on disk, reloading.")
+        recording = load_motion(path)
+
+        with self._lock:
+            self._drop(name)
+            self._entries[name] = (recording, (path, stat.st_mtime), stat.st_size)
+            self._total_bytes += stat.st_size
+            self._evict()
+
+        return recording
+
+    def __contains__(self, name):
+        return self._resolve(name) is not None
+
+    def _resolve(self, name):
+        """Pick the file backing name (the .nmr one if it exists), returns (path, stat) or None."""
+        for path in (join(self.motion_dir, name + MOTION_EXT), join(self.motion_dir, name)):
+            try:
+                return path, os.stat(path)
+            except OSError:
+                continue
+        return None
+
+    def _refresh(self, name, path, stat):
+        """Convert the pickled recording if it is newer than the .nmr file, returns the (path, stat) to load."""
+        pickled = join(self.motion_dir, name)
+        if not path.endswith(MOTION_EXT) or not _newer(pickled, stat):
+            return path, stat
+
+        with self._convert_lock:
+            # Another thread may have converted it while this one waited
+            stat = os.stat(path)
+            if _newer(pickled, stat):
+                try:
+                    convert(pickled, path)
+                    # Same mtime as its source, so a clock ahead of ours can't make it look stale again
+                    recorded = os.stat(pickled)
+                    os.utime(path, ns=(recorded.st_atime_ns, recorded.st_mtime_ns))
+                except Exception as e:
+                    if self.logger:
+                        self.logger.error(f"Could not convert re-recorded motion '{name}', playing the old one: {e}")
+                    return path, stat
+                if self.logger:
+                    self.logger.info(f"Motion '{name}' was re-recorded, converted it to {MOTION_EXT}.")
+            return path, os.stat(path)
+
+    def _forget(self, name):
+        with self._lock:
+            self._drop(name)
+
+    def _drop(self, name):
+        entry = self._entries.pop(name, None)
+        if entry is not None:
+            self._total_bytes -= entry[2]
+
+    def _evict(self):
+        # Always keep the most recent entry, even if it alone exceeds the budget
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            name, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry[2]
+            if self.logger:
+                self.logger.info(f"Motion library: evicted '{name}'.")
+
+
+def _newer(path, stat):
+    try:
+        return os.stat(path).st_mtime > stat.st_mtime
+    except OSError:
+        return False
@@ -0,0 +1,234 @@
+"""
+Retiming of recorded motions: time-scale, cubic resampling, smoothing and tempo sync.
+
+All joints that share a time track are processed as one (joints x samples) array,
+so retiming a whole dance is a handful of NumPy operations instead of a Python loop
+per sample. Retimer caches the results per (motion, tempo, speed).
+
+In a scripted intent's "timeline", "tempo" (BPM) syncs the recorded motions of the
+beat to that tempo and "speed" plays them faster (> 1) or slower (< 1), e.g.
+    "accept_can_dance": {"gestures": [...], "timeline": {"tempo": 118}}
+The recorded tempo of a motion comes from MOTION_BPM, or is estimated from the
+periodicity of its joint movement. NAOqi still clamps joint speeds on the robot.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sic_framework.devices.common_naoqi.naoqi_motion_recorder import NaoqiMotionRecording
+
+from theater_performance import clock
+from theater_performance.config import (
+    MOTION_RETIME_CACHE_SIZE,
+    MOTION_RESAMPLE_RATE,
+    MOTION_SMOOTHING,
+    MOTION_BPM
+)
+
+
+def tracks(recording):
+    """
+    Group the joints of a recording by time track.
+
+    Returns [(joint indices, times (n,), angles (joints, n))], float64 arrays.
+    """
+    groups = OrderedDict()
+    for i, t in enumerate(recording.recorded_times):
+        t = np.asarray(t, dtype=np.float64)
+        groups.setdefault(t.tobytes(), (t, []))[1].append(i)
+
+    return [
+        (indices, t, np.array([recording.recorded_angles[i] for i in indices], dtype=np.float64).reshape(len(indices), -1))
+        for t, indices in groups.values()
+    ]
+
+
+def cubic_resample(times, angles, new_times):
+    """
+    Cubic Hermite interpolation of angles (joints, n) sampled at times onto new_times.
+
+    Tangents are finite differences over the neighbouring samples (Catmull-Rom on a
+    non-uniform grid), so the curve passes through every recorded sample.
+    """
+    n = len(times)
+    if n < 2:
+        return np.repeat(angles[:, :1], len(new_times), axis=1) if n else np.zeros((len(angles), len(new_times)))
+
+    tangents = np.empty_like(angles)
+    tangents[:, 1:-1] = (angles[:, 2:] - angles[:, :-2]) / (times[2:] - times[:-2])
+    tangents[:, 0] = (angles[:, 1] - angles[:, 0]) / (times[1] - times[0])
+    tangents[:, -1] = (angles[:, -1] - angles[:, -2]) / (times[-1] - times[-2])
+
+    new_times = np.clip(new_times, times[0], times[-1])
+    i = np.clip(np.searchsorted(times, new_times, side="right") - 1, 0, n - 2)
+    h = times[i + 1] - times[i]
+    s = (new_times - times[i]) / h
+
+    s2 = s * s
+    s3 = s2 * s
+    h00 = 2 * s3 - 3 * s2 + 1
+    h10 = s3 - 2 * s2 + s
+    h01 = -2 * s3 + 3 * s2
+    h11 = s3 - s2
+
+    return (
+        h00 * angles[:, i] + h10 * h * tangents[:, i]
+        + h01 * angles[:, i + 1] + h11 * h * tangents[:, i + 1]
+    )
+
+
+def smooth(angles, window):
+    """Centered moving average over window samples (edges padded), per joint."""
+    if window <= 1 or angles.shape[1] < 2:
+        return angles
+    before = window // 2
+    padded = np.pad(angles, ((0, 0), (before, window - 1 - before)), mode="edge")
+    sums = np.cumsum(padded, axis=1)
+    sums = np.concatenate([np.zeros((len(angles), 1)), sums], axis=1)
+    return (sums[:, window:] - sums[:, :-window]) / window
+
+
+def estimate_bpm(recording, low=60.0, high=180.0, rate=MOTION_RESAMPLE_RATE):
+    """Tempo of a motion from the autocorrelation of its overall joint speed, or None."""
+    activity = None
+    grid = None
+    for _, t, a in tracks(recording):
+        if len(t) < 2:
+            continue
+        if grid is None:
+            grid = np.arange(t[0], t[-1], 1.0 / rate)
+        if len(grid) < 2:
+            return None
+        speed = np.abs(np.diff(cubic_resample(t, a, grid), axis=1)).sum(axis=0)
+        activity = speed if activity is None else activity + speed
+    if activity is None:
+        return None
+
+    activity = activity - activity.mean()
+    size = 2 * len(activity)
+    spectrum = np.fft.rfft(activity, size)
+    autocorr = np.fft.irfft(spectrum * np.conj(spectrum), size)[:len(activity)]
+
+    first, last = int(np.ceil(rate * 60.0 / high)), int(rate * 60.0 / low)
+    if first < 1 or last + 1 >= len(autocorr) or autocorr[0] <= 0:
+        return None
+
+    # Strongest local maximum in the tempo range; none means no regular beat
+    lags = np.arange(first, last + 1)
+    window = autocorr[lags]
+    peaks = lags[(window > autocorr[lags - 1]) & (window >= autocorr[lags + 1]) & (window > 0)]
+    if not len(peaks):
+        return None
+    lag = peaks[np.argmax(autocorr[peaks])]
+
+    # Parabolic interpolation between the samples around the peak, for sub-sample lags
+    before, peak, after = autocorr[lag - 1:lag + 2]
+    curvature = before - 2 * peak + after
+    offset = 0.5 * (before - after) / curvature if curvature < 0 else 0.0
+    return 60.0 * rate / (lag + offset)
+
+
+def retime(recording, speed=1.0, bpm=None, source_bpm=None,
+           rate=MOTION_RESAMPLE_RATE, window=MOTION_SMOOTHING):
+    """
+    A new recording that plays speed times faster and/or at bpm instead of source_bpm.
+
+    Every joint is resampled (cubic) onto one uniform grid of rate samples per second
+    of the new timing, then smoothed with a window-sample moving average.
+    """
+    if speed <= 0:
+        raise ValueError("Motion speed must be positive.")
+    scale = 1.0 / speed
+    if bpm is not None:
+        if not source_bpm:
+            raise ValueError("Tempo sync needs the recorded tempo of the motion.")
+        scale *= source_bpm / bpm
+
+    groups = tracks(recording)
+    starts = [t[0] for _, t, _ in groups if len(t)]
+    ends = [t[-1] for _, t, _ in groups if len(t)]
+    if not starts:
+        return recording
+
+    # New timing, sampled at rate; the recording's first sample time is kept as lead-in
+    new_times = np.arange(min(starts) * scale, max(ends) * scale + 0.5 / rate, 1.0 / rate)
+
+    angles = [None] * len(recording.recorded_joints)
+    for indices, t, a in groups:
+        resampled = smooth(cubic_resample(t * scale, a, new_times), window)
+        for row, i in enumerate(indices):
+            angles[i] = resampled[row]
+
+    # Arrays like the motion library's recordings, motion_format.for_robot converts for NAO
+    return NaoqiMotionRecording(
+        list(recording.recorded_joints),
+        angles,
+        [new_times for _ in angles],
+    )
+
+
+class Retimer:
+    """Retimed versions of the motion library's recordings, cached per (motion, tempo, speed)."""
+
+    def __init__(self, motions, cache_size=MOTION_RETIME_CACHE_SIZE, logger=None):
+        self.motions = motions
+        self.cache_size = cache_size
+        self.logger = logger
+
+        # (name, tempo, speed) -> (source recording, retimed recording)
+        self._cache = OrderedDict()
+        # name -> (source recording, bpm)
+        self._bpm = {}
+        self._lock = threading.Lock()
+
+    def get(self, name, tempo=None, speed=1.0):
+        """The recording for name at tempo (BPM) and speed, None if there is no such motion."""
+        recording = self.motions.get(name)
+        if recording is None or (tempo is None and speed == 1.0):
+            return recording
+
+        key = (name, tempo, speed)
+        with self._lock:
+            entry = self._cache.get(key)
+            # Only valid for the recording it was made from (re-recorded motions reload)
+            if entry is not None and entry[0] is recording:
+                self._cache.move_to_end(key)
+                return entry[1]
+
+        source_bpm = self.source_bpm(name) if tempo is not None else None
+        if tempo is not None and not source_bpm:
+            if self.logger:
+                self.logger.error(f"Unknown tempo of '{name}', add it to MOTION_BPM. Playing it untimed.")
+            tempo = None
+
+        start = clock.perf_counter()
+        retimed = retime(recording, speed=speed, bpm=tempo, source_bpm=source_bpm)
+        if self.logger:
+            self.logger.info(
+                f"Retimed '{name}' (tempo={tempo}, speed={speed}) in {(clock.perf_counter() - start) * 1000:.1f} ms"
+            )
+
+        with self._lock:
+            self._cache[key] = (recording, retimed)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return retimed
+
+    def source_bpm(self, name):
+        """Recorded tempo of a motion, from MOTION_BPM or estimated once per recording."""
+        if name in MOTION_BPM:
+            return MOTION_BPM[name]
+
+        recording = self.motions.get(name)
+        with self._lock:
+            entry = self._bpm.get(name)
+        if entry is not None and entry[0] is recording:
+            return entry[1]
+
+        bpm = estimate_bpm(recording)
+        if self.logger:
+            self.logger.info(f"Estimated tempo of '{name}': {bpm and round(bpm, 1)} BPM")
+        with self._lock:
+            self._bpm[name] = (recording, bpm)
+        return bpm
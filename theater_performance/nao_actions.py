@@ -1,58 +1,178 @@
-import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from os.path import dirname, abspath, join
 
-from sic_framework.devices import Nao
 from sic_framework.devices.nao import NaoqiTextToSpeechRequest
 from sic_framework.devices.common_naoqi.naoqi_motion import (
     NaoPostureRequest,
     NaoqiAnimationRequest
 )
-from sic_framework.devices.common_naoqi.naoqi_motion_recorder import (
-    NaoqiMotionRecording,
-    PlayRecording
-)
+from sic_framework.devices.common_naoqi.naoqi_motion_recorder import PlayRecording
 from sic_framework.devices.common_naoqi.naoqi_autonomous import NaoRestRequest
+from sic_framework.core.message_python2 import AudioRequest
 
-from theater_performance.config import NAO_IP
+from theater_performance import clock
+from theater_performance.config import (
+    NAO_IP,
+    ANIMATION_DURATION,
+    MOTION_SETUP_TIME,
+    MOTION_STOP_SPEED,
+    TTS_WORDS_PER_SECOND,
+    TTS_CACHE_ENABLED,
+    TTS_LIVE_ENGINE
+)
+from theater_performance.devices import devices
+from theater_performance.motion_format import for_robot
+from theater_performance.motion_library import MotionLibrary
+from theater_performance.motion_retime import Retimer
+from theater_performance.tracing import traced
+from theater_performance.tts_cache import TTSCache
 
 
 # Path to /theater_performance/motion
 MOTION_DIR = join(dirname(abspath(__file__)), "motion")
 
+# The Nao connectors NaoActions uses
+CONNECTORS = ("tts", "speaker", "motion", "motion_record", "autonomous")
+
 
 class NaoActions:
     def __init__(self, logger=None):
         self.logger = logger
-        self.nao = Nao(ip=NAO_IP)
+        self.ip = NAO_IP
+        self.nao = devices.acquire(self.ip)
+        # Last posture we asked for ("Stand", "Sit", "Rest"), None until the first request
+        self.posture = None
+        # Set by interrupt(), stops waiting for the current line
+        self.interrupted = threading.Event()
+        # A PlayRecording request is running, stop() can end it
+        self.playing_recording = False
+
+        # Recorded motions, call motions.preload() to decode them all before the first cue
+        self.motions = MotionLibrary(MOTION_DIR, logger=logger)
+        # Recorded motions at another tempo / speed, made from the library on demand
+        self.retimer = Retimer(self.motions, logger=logger)
+
+        # Pre-rendered audio for script lines, None when NAO's own TTS says everything
+        self.tts_cache = TTSCache(logger=logger) if TTS_CACHE_ENABLED else None
+
+    def connect(self):
+        """Start all connectors now instead of on first use, concurrently."""
+        # SIC starts a connector (component start + ping) the first time it is accessed
+        starts = [lambda name=name: getattr(self.nao, name) for name in CONNECTORS]
+        with ThreadPoolExecutor(max_workers=len(starts)) as pool:
+            list(pool.map(lambda start: start(), starts))
+
+        # Not part of startup, the show does not depend on google-tts (say falls back to NAO's TTS)
+        if self.tts_cache is not None and TTS_LIVE_ENGINE == "google":
+            threading.Thread(target=self._connect_tts, name="google-tts-connect", daemon=True).start()
+
+    def _connect_tts(self):
+        try:
+            self.tts_cache.connect()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Could not connect to google-tts, uncached lines use NAO's TTS: {e}")
 
-    def say(self, text):
+    @traced("nao.say")
+    def say(self, text, on_audio=None):
+        """
+        Say text, returns once it has been said.
+
+        on_audio(started_at) is called with the clock.monotonic() time NAO started
+        playing the line: when its audio went to the speakers, or for NAO's own TTS
+        (which doesn't report that) the time it returned minus the spoken length.
+        """
         if self.logger:
             self.logger.info(f"NAO says: {text}")
-        self.nao.tts.request(NaoqiTextToSpeechRequest(text))
 
-    def do_gesture(self, animation):
+        audio = self._audio(text)
+        if audio is None:
+            sent = clock.monotonic()
+            self.nao.tts.request(NaoqiTextToSpeechRequest(text))
+            if on_audio is not None:
+                on_audio(max(sent, clock.monotonic() - self.speech_duration(text)))
+            return
+
+        # Stream the waveform and return when it has been played, like NAO's TTS
+        waveform, sample_rate = audio
+        start = clock.monotonic()
+        if on_audio is not None:
+            on_audio(start)
+        self.nao.speaker.request(AudioRequest(waveform=waveform, sample_rate=sample_rate))
+        remaining = len(waveform) / (2 * sample_rate) - (clock.monotonic() - start)
+        if remaining > 0:
+            clock.wait(self.interrupted, remaining)
+
+    def _audio(self, text):
+        """(waveform, sample_rate) to stream for text, or None to use NAO's TTS."""
+        if self.tts_cache is None:
+            return None
+        if TTS_LIVE_ENGINE != "google":
+            return self.tts_cache.get(text)
+        try:
+            return self.tts_cache.speech(text)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Live google-tts failed, using NAO's TTS: {e}")
+            return None
+
+    def interrupt(self):
+        """
+        Stop waiting for the current line, until clear_interrupt().
+
+        NAOqi has no stop for a TTS or animation request that was already sent,
+        those finish on the robot; callers skip whatever they had not sent yet.
+        """
+        self.interrupted.set()
+
+    def stop(self):
+        """
+        interrupt(), and end a recorded motion that is playing so the next one can start.
+
+        The recording is ended by a posture request on the motion connector: ALMotion
+        gives the joints to the newer task. Lines already sent to the TTS or the
+        speakers can't be stopped through SIC and finish on the robot.
+        """
+        self.interrupt()
+        if self.playing_recording and self.posture == "Stand":
+            if self.logger:
+                self.logger.info("Stopping the recorded motion.")
+            self.nao.motion.request(NaoPostureRequest("Stand", MOTION_STOP_SPEED), block=False)
+
+    def clear_interrupt(self):
+        self.interrupted.clear()
+
+    @traced("nao.do_gesture")
+    def do_gesture(self, animation, block=False, tempo=None, speed=1.0):
         """
         Extended version:
         - If animation starts with 'animations/', treat it as a built-in NAO animation.
-        - Otherwise, treat it as a recorded motion file in /theater_performance/motion/.
+        - Otherwise, treat it as a recorded motion file in /theater_performance/motion/,
+          retimed to tempo (BPM) and speed if given (see motion_retime).
+
+        Recorded motions always block; block=True also waits for built-in animations.
         """
         try:
             # CASE 1 → Built-in NAO animation (unchanged behaviour)
             if animation.startswith("animations/"):
                 if self.logger:
                     self.logger.info(f"Gesture (animation): {animation}")
-                self.nao.motion.request(NaoqiAnimationRequest(animation), block=False)
+                self.nao.motion.request(NaoqiAnimationRequest(animation), block=block)
                 return
 
             # CASE 2 → Recorded motion from your /motion folder
-            motion_path = join(MOTION_DIR, animation)
+            recording = self.retimer.get(animation, tempo=tempo, speed=speed)
 
-            if os.path.exists(motion_path):
+            if recording is not None:
                 if self.logger:
-                    self.logger.info(f"Playing recorded motion: {motion_path}")
+                    self.logger.info(f"Playing recorded motion: {join(MOTION_DIR, animation)}")
 
-                recording = NaoqiMotionRecording.load(motion_path)
-                self.nao.motion_record.request(PlayRecording(recording))
+                self.playing_recording = True
+                try:
+                    self.nao.motion_record.request(PlayRecording(for_robot(recording)))
+                finally:
+                    self.playing_recording = False
                 return
 
             # If neither animation nor motion exists
@@ -63,17 +183,46 @@ class NaoActions:
             if self.logger:
                 self.logger.error(f"Error executing gesture '{animation}': {e}")
 
+    def gesture_duration(self, animation, tempo=None, speed=1.0):
+        """Estimated playback time of a gesture in seconds."""
+        if animation.startswith("animations/"):
+            return ANIMATION_DURATION
+
+        recording = self.retimer.get(animation, tempo=tempo, speed=speed)
+        if recording is None or not recording.recorded_times:
+            return 0.0
+        return MOTION_SETUP_TIME + max(
+            (times[-1] for times in recording.recorded_times if len(times)), default=0.0
+        )
+
+    def speech_duration(self, text):
+        """Estimated time NAO needs to say text, in seconds."""
+        if self.tts_cache is not None:
+            cached = self.tts_cache.duration(text) if text else None
+            if cached is not None:
+                return cached
+        return len((text or "").split()) / TTS_WORDS_PER_SECOND
+
+    @traced("nao.set_stand")
     def set_stand(self):
         if self.logger:
             self.logger.info("Setting posture → Stand.")
         self.nao.motion.request(NaoPostureRequest("Stand", 0.5))
+        self.posture = "Stand"
         
+    @traced("nao.rest")
     def rest(self):
         if self.logger:
             self.logger.info("NAO going to rest mode.")
         self.nao.autonomous.request(NaoRestRequest())
+        self.posture = "Rest"
 
     def sit(self):
         if self.logger:
             self.logger.info("Setting posture → Sit.")
-        self.nao.motion.request(NaoPostureRequest("Sit", 0.5))
\ No newline at end of file
+        self.nao.motion.request(NaoPostureRequest("Sit", 0.5))
+        self.posture = "Sit"
+
+    def close(self):
+        """Give the shared Nao back to the device registry."""
+        devices.release(self.ip)
@@ -0,0 +1,158 @@
+"""
+Operator console: manual control of the show over a localhost line protocol.
+
+Connect with any line-based client while the show runs:
+    nc localhost 8765          (or: telnet localhost 8765)
+
+Commands:
+    list            numbered scripted beats, with the learned line
+    fire <beat>     perform a beat now (name or number from list), instead of
+                    whatever NAO is doing or about to do (a recorded motion that
+                    is playing is stopped, a line being said still finishes)
+    skip            cut the current action short, queued turns go on
+    repeat          perform the current (or last) turn again
+    abort           cut the current action short and drop the queued turns
+    status          what NAO is doing and how many turns are queued
+    stats           stage latencies so far (p50 / p95 / p99), operator.fire_to_cue
+                    is keypress to the first command sent to NAO
+    help, quit
+
+Commands go through the show loop as OPERATOR events, so they are handled ahead of
+detected intents and never wait for a CX request.
+"""
+import asyncio
+
+from theater_performance import clock
+from theater_performance.config import OPERATOR_HOST, OPERATOR_PORT
+from theater_performance.show_loop import OPERATOR
+from theater_performance.tracing import tracer
+from theater_performance.turn import Turn
+
+
+class OperatorConsole:
+    def __init__(self, show_loop, controller, host=OPERATOR_HOST, port=OPERATOR_PORT, logger=None):
+        self.show_loop = show_loop
+        self.controller = controller
+        self.host = host
+        self.port = port
+        self.logger = logger
+
+        self.commands = {
+            "list": self._list,
+            "fire": self._fire,
+            "skip": self._skip,
+            "repeat": self._repeat,
+            "abort": self._abort,
+            "status": self._status,
+            "stats": self._stats,
+            "help": self._help,
+        }
+
+        show_loop.on(OPERATOR, self._on_command)
+        show_loop.services.append(self.serve)
+
+    async def serve(self):
+        try:
+            server = await asyncio.start_server(self._client, self.host, self.port)
+        except OSError as e:
+            if self.logger:
+                self.logger.error(f"Could not start the operator console on {self.host}:{self.port}: {e}")
+            return
+        if self.logger:
+            self.logger.info(f"Operator console on {self.host}:{self.port}")
+        async with server:
+            await server.serve_forever()
+
+    async def _client(self, reader, writer):
+        writer.write(b"Operator console, type 'help' for commands.\n")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode("utf-8", "replace").split()
+                if not words:
+                    continue
+                if words[0] == "quit":
+                    break
+                self.show_loop.post(OPERATOR, (words[0], words[1:], writer, clock.monotonic()))
+        finally:
+            writer.close()
+
+    def _on_command(self, event):
+        name, args, writer, received_at = event.payload
+        command = self.commands.get(name)
+        if command is None:
+            reply = f"error unknown command '{name}', try 'help'"
+        else:
+            try:
+                reply = command(args, received_at)
+            except Exception as e:
+                reply = f"error {e}"
+        tracer.record(f"operator.{name}", clock.monotonic() - received_at)
+
+        if self.logger and name not in ("list", "status", "stats", "help"):
+            self.logger.info(f"Operator: {name} {' '.join(args)} -> {reply.splitlines()[0]}")
+        if not writer.is_closing():
+            writer.write((reply + "\n").encode("utf-8"))
+
+    # ---- commands ----
+
+    def _beats(self):
+        return list(self.controller.dialogflow.scripted_intents)
+
+    def _list(self, args, received_at):
+        lines = []
+        for i, name in enumerate(self._beats(), 1):
+            line = self.controller.script_lines.get(name) or "(no line learned yet)"
+            lines.append(f"{i:3} {name:28} {line}")
+        return "\n".join(lines)
+
+    def _fire(self, args, received_at):
+        if not args:
+            return "error usage: fire <beat name or number>"
+        beats = self._beats()
+        name = args[0]
+        if name.isdigit() and 1 <= int(name) <= len(beats):
+            name = beats[int(name) - 1]
+        if name not in beats:
+            return f"error unknown beat '{name}'"
+
+        line = self.controller.script_lines.get(name)
+        turn = self.controller.scripted_turn(name, "(operator)", line, fired_at=received_at)
+        self.show_loop.perform_now(turn)
+        return f"ok fired {name}"
+
+    def _skip(self, args, received_at):
+        if self.show_loop.speaking is None:
+            return "ok nothing to skip"
+        self.show_loop.skip()
+        return "ok skipped"
+
+    def _repeat(self, args, received_at):
+        last = self.show_loop.speaking or self.show_loop.last_turn
+        if last is None:
+            return "error nothing performed yet"
+        turn = Turn(last.intent_name, last.user_input, gestures=last.gestures, line=last.text,
+                    timeline=last.timeline, fired_at=received_at)
+        self.show_loop.perform_now(turn)
+        return f"ok repeating {last.intent_name or 'LLM reply'}"
+
+    def _abort(self, args, received_at):
+        self.show_loop.abort()
+        return "ok aborted"
+
+    def _status(self, args, received_at):
+        turn = self.show_loop.speaking
+        doing = f"{turn.intent_name or 'LLM reply'}: {turn.text}" if turn is not None else "idle"
+        return f"ok {doing} | queued {self.show_loop.pending} | act {self.controller.current_state}"
+
+    def _stats(self, args, received_at):
+        lines = [
+            f"{stage:28} n={s['count']:<4} p50={s['p50_ms']:>8.1f}ms p95={s['p95_ms']:>8.1f}ms p99={s['p99_ms']:>8.1f}ms"
+            for stage, s in tracer.summary().items()
+        ]
+        return "\n".join(lines) or "ok no latencies yet"
+
+    def _help(self, args, received_at):
+        return __doc__.split("Commands:")[1].split("Commands go")[0].strip("\n")
@@ -1,6 +1,19 @@
+import threading
+
+from theater_performance import clock
+from theater_performance.acts import ActStateMachine
+from theater_performance.config import LLM_STREAMING, OPENING_LINE
+from theater_performance.devices import devices
 from theater_performance.dialogflow_handler import DialogflowHandler
 from theater_performance.nao_actions import NaoActions
 from theater_performance.llm_handler import LLMHandler
+from theater_performance.prefetch import Lookahead
+from theater_performance.script_lines import ScriptLines
+from theater_performance.sentence_stream import SentenceStream
+from theater_performance.startup import Startup
+from theater_performance.timeline import Timeline
+from theater_performance.tracing import tracer
+from theater_performance.turn import Turn
 
 
 class PerformanceController:
@@ -8,27 +21,100 @@ class PerformanceController:
 
     def __init__(self, logger=None):
         self.logger = logger
+        devices.logger = logger
 
-        self.nao = NaoActions(logger=logger)
-        self.dialogflow = DialogflowHandler()
-        self.llm = LLMHandler(logger=logger)
+        # Subsystems come up concurrently, the opening line only waits for NAO itself
+        self.startup = Startup(logger=logger)
+        self.startup.add("script_lines", lambda: ScriptLines(logger=logger))
+        self.startup.add("nao", lambda: NaoActions(logger=logger), probe=NaoActions.connect)
+        self.startup.add("motions", lambda nao: nao.motions.preload(), requires=("nao",))
+        self.startup.add(
+            "dialogflow",
+            lambda script_lines: DialogflowHandler(script_lines=script_lines),
+            requires=("script_lines",)
+        )
+        self.startup.add("llm", lambda: LLMHandler(logger=logger))
+        self.startup.add(
+            "lookahead",
+            self._create_lookahead,
+            requires=("nao", "dialogflow", "script_lines", "motions")
+        )
+        self.startup.start()
 
-        self.current_state = "INTRODUCTION"
+        # The act the show is in, moved along by the scripted beats. Beats are decided
+        # on the show loop's threads and fired by the operator, _act_lock keeps the act,
+        # the prediction and the local matcher's candidates in step
+        self.acts = ActStateMachine(logger=logger)
+        self._act_lock = threading.Lock()
         self.finished = False
+        # Turn being performed, for interrupt()
+        self.current = None
+        # shutdown() runs once, from the final turn or from main
+        self._shut_down = False
+        self._shutdown_lock = threading.Lock()
+
+    @property
+    def current_state(self):
+        with self._act_lock:
+            return self.acts.state
+
+    # Subsystems, each blocks until it has started
+
+    @property
+    def script_lines(self):
+        return self.startup.get("script_lines")
+
+    @property
+    def nao(self):
+        return self.startup.get("nao")
+
+    @property
+    def dialogflow(self):
+        return self.startup.get("dialogflow")
+
+    @property
+    def llm(self):
+        return self.startup.get("llm")
+
+    @property
+    def lookahead(self):
+        return self.startup.get("lookahead")
+
+    def _create_lookahead(self, nao, dialogflow, script_lines, motions):
+        lookahead = Lookahead(nao, dialogflow, script_lines, logger=self.logger)
+        if nao.tts_cache is not None:
+            lookahead.warmers.append(self._warm_line)
+        return lookahead
 
     def start_performance(self):
         self.nao.set_stand()
-        self.nao.say("Hello, I am Cody, nice to meet you!")
+        self.nao.say(OPENING_LINE)
         if self.logger:
-            self.logger.info("Performance started.")
+            self.logger.info(f"Performance started ({self.startup.elapsed():.2f}s after startup).")
+
+        # The rest came up while NAO was talking, the first turn needs all of it
+        failed = self.startup.wait()
+        if failed:
+            raise RuntimeError(f"Could not start: {', '.join(failed)}")
+
+        unassigned = self.acts.check(self.dialogflow.scripted_intents)
+        if unassigned and self.logger:
+            self.logger.error(f"Scripted intents without an act: {unassigned}")
+        self.dialogflow.local_candidates = self.acts.settled()
 
     def process_interaction(self):
+        """One full turn in series: listen, decide, act."""
         reply, intent_name = self.dialogflow.detect_intent()
+        turn = self.decide(reply, intent_name)
+        if turn is not None:
+            self.act(turn)
 
+    def decide(self, reply, intent_name):
+        """Turn a Dialogflow reply into the Turn NAO should perform (None if nothing was heard)."""
         if not reply or not reply.transcript:
             if self.logger:
                 self.logger.info(" No speech detected.")
-            return
+            return None
 
         user_input = reply.transcript
         fulfillment = reply.fulfillment_message
@@ -36,40 +122,161 @@ class PerformanceController:
         # Scripted intent
         if intent_name and self.dialogflow.is_scripted_intent(intent_name):
 
-            gestures = self.dialogflow.get_gestures(intent_name)
-
-            if self.logger:
-                self.logger.info(f"Scripted intent: {intent_name}")
-                self.logger.info(f"Gestures: {gestures}")
-                self.logger.info(f"Scripted line: {fulfillment}")
-
-            # Play gestures in order
-            for g in gestures:
-                self.nao.do_gesture(g)
-
-            # Speak scripted Dialogflow line
-            if fulfillment:
-                self.nao.say(fulfillment)
-                
-            # After the very last intent, make NAO rest
-            if intent_name == "final_ending":
-                if self.logger:
-                    self.logger.info("Final intent 'final_ending' reached - NAO sits.")
-                self.nao.sit()
-                self.shutdown()
-                self.finished = True
-            return
+            self.script_lines.learn(intent_name, fulfillment)
+            return self.scripted_turn(intent_name, user_input, fulfillment)
 
         # LLM fallback
+        fallback_at = clock.monotonic()
+
+        if LLM_STREAMING:
+            # Tokens keep streaming in the background, act() speaks each finished sentence
+            stream = SentenceStream(self.llm.generate_stream(
+                state=self.current_state,
+                user_input=user_input
+            ))
+            return Turn(intent_name, user_input, stream=stream, fallback_at=fallback_at)
+
         response = self.llm.generate(
             state=self.current_state,
             user_input=user_input
         )
-        self.nao.say(response)
+        return Turn(intent_name, user_input, line=response, fallback_at=fallback_at)
+
+    def scripted_turn(self, intent_name, user_input, line, fired_at=None):
+        """The Turn for a scripted beat: its gestures, timeline and line."""
+        gestures = self.dialogflow.get_gestures(intent_name)
+
+        if self.logger:
+            self.logger.info(f"Scripted intent: {intent_name}")
+            self.logger.info(f"Gestures: {gestures}")
+            self.logger.info(f"Scripted line: {line}")
+
+        with self._act_lock:
+            self.lookahead.observe(intent_name)
+            # The local matcher only fires beats of this act, moving on is left to CX
+            self.acts.advance(intent_name)
+            self.dialogflow.local_candidates = self.acts.settled()
+
+        return Turn(
+            intent_name,
+            user_input,
+            gestures=gestures,
+            line=line,
+            timeline=self.dialogflow.get_timeline(intent_name),
+            final=intent_name == "final_ending",
+            fired_at=fired_at
+        )
+
+    def act(self, turn):
+        """Perform a decided turn on the robot, returns early once the turn is cancelled."""
+        if turn.cancelled.is_set():
+            return
+        self.current = turn
+        self.nao.clear_interrupt()
+        if turn.stream is not None:
+            self._speak_stream(turn)
+            return
+
+        # Gestures and the scripted Dialogflow line / LLM reply share one timeline
+        timeline = Timeline.plan(self.nao, turn.gestures, turn.line, turn.timeline, logger=self.logger)
+        turn.playing = timeline
+        if turn.fallback_at is not None:
+            for cue in timeline.cues:
+                if cue.kind == "speech":
+                    cue.options["on_audio"] = lambda started_at: self._log_first_audio(turn, started_at)
+        if turn.fired_at is not None:
+            # Keypress to the first command sent to NAO
+            timeline.on_start = lambda: tracer.record("operator.fire_to_cue", clock.monotonic() - turn.fired_at)
+        if turn.cancelled.is_set():
+            return
+        timeline.run(self.nao)
+        if turn.cancelled.is_set():
+            return
+
+        # After the very last intent, make NAO rest
+        if turn.final:
+            if self.logger:
+                self.logger.info("Final intent 'final_ending' reached - NAO sits.")
+            self.nao.sit()
+            self.shutdown()
+            self.finished = True
+            return
+
+        self.lookahead.prepare_posture()
+
+    def interrupt(self):
+        """Cut the turn NAO is performing short (cues not started yet are skipped)."""
+        turn = self.current
+        if turn is not None:
+            turn.cancel()
+        if self.startup.ready("nao"):
+            self.nao.stop()
+
+    def _warm_line(self, intent_name, gestures, line):
+        if line:
+            self.nao.tts_cache.warm(line)
+
+    def _speak_stream(self, turn):
+        for i, sentence in enumerate(turn.stream):
+            if turn.cancelled.is_set():
+                break
+            on_audio = (lambda started_at: self._log_first_audio(turn, started_at)) if i == 0 else None
+            self.nao.say(sentence, on_audio=on_audio)
+
+        if turn.stream.error and self.logger:
+            self.logger.error(f"LLM stream failed: {turn.stream.error}")
+
+    def _log_first_audio(self, turn, started_at):
+        # Until NAO started playing the first words (synthesis included), from when the
+        # fallback started or when NAO was free for it if that came later: waiting for
+        # the turn before (show.queue_wait) is not the LLM's time
+        ttfa = started_at - max(turn.fallback_at, turn.free_at or turn.fallback_at)
+        tracer.record("llm.time_to_first_audio", ttfa)
+        if self.logger:
+            self.logger.info(f"LLM time-to-first-audio: {ttfa * 1000:.0f} ms")
+
+    def report_latencies(self):
+        """Log p50/p95/p99 per stage and write this show's JSON report."""
+        extra = {}
+        if self.startup.ready("dialogflow") and self.dialogflow.report() is not None:
+            extra["local_match"] = self.dialogflow.report()
+        if self.startup.ready("llm"):
+            extra["llm_requests"] = self.llm.report()
+            if self.llm.cache is not None:
+                extra["llm_cache"] = self.llm.cache.report()
+        path = tracer.write_report(extra=extra)
+        if self.logger:
+            tracer.log_summary(self.logger)
+            self.logger.info(f"Latency report written to {path}")
 
     def shutdown(self):
-        
+        """Rest NAO, write the show report and release everything; later calls do nothing."""
+        with self._shutdown_lock:
+            if self._shut_down:
+                return
+            self._shut_down = True
+
+        # Skip whatever never came up
+        ready = self.startup.ready
+        if ready("lookahead"):
+            self.lookahead.shutdown()
+
         if self.logger:
-            self.nao.rest()
+            if ready("nao"):
+                self.nao.rest()
             self.finished = True
-            self.logger.info("Performance shutdown complete.")
\ No newline at end of file
+            if ready("llm"):
+                self.logger.info(f"LLM requests: {self.llm.report()}")
+                if self.llm.cache is not None:
+                    self.logger.info(f"LLM cache: {self.llm.cache.report()}")
+            self.logger.info("Performance shutdown complete.")
+
+        self.report_latencies()
+
+        if ready("llm"):
+            self.llm.close()
+        # Both hold the one shared Nao, the last release stops its connectors
+        if ready("dialogflow"):
+            self.dialogflow.close()
+        if ready("nao"):
+            self.nao.close()
\ No newline at end of file
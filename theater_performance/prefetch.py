@@ -0,0 +1,95 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from theater_performance.config import PREFETCH_DEPTH
+
+
+class Lookahead:
+    """
+    Predicts the next scripted beats and pre-warms their resources while the
+    current beat is still playing.
+
+    Prediction: successors seen earlier in the show (most frequent first), then the
+    beats that follow in script order (the order of scripted_intents).
+
+    Warming, for every predicted beat:
+    - recorded motions are pulled into the motion library (decoded, mtime checked)
+      and retimed if the beat has a tempo / speed
+    - every function in self.warmers is called as warmer(intent_name, gestures, line),
+      line being the fulfillment learned from earlier CX replies (or None)
+    - after the current beat, prepare_posture() makes sure NAO stands if the next
+      beat needs it, so that change is not on the cue path either
+    """
+
+    def __init__(self, nao, dialogflow, script_lines, depth=PREFETCH_DEPTH, logger=None):
+        self.nao = nao
+        self.dialogflow = dialogflow
+        self.script_lines = script_lines
+        self.depth = depth
+        self.logger = logger
+
+        self.order = list(dialogflow.scripted_intents)
+        self.transitions = {}
+        self.predicted = []
+        self.warmers = []
+
+        self._previous = None
+        # One worker: warming is best effort and must not compete with the cue itself
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+    def predict(self, intent_name):
+        """Most likely next scripted intents after intent_name."""
+        seen = [name for name, _ in self.transitions.get(intent_name, Counter()).most_common()]
+
+        if intent_name in self.order:
+            i = self.order.index(intent_name)
+            upcoming = self.order[i + 1:i + 1 + self.depth]
+        else:
+            upcoming = self.order[:self.depth]
+
+        predicted = []
+        for name in seen + upcoming:
+            if name not in predicted and name != intent_name:
+                predicted.append(name)
+        return predicted[:self.depth]
+
+    def observe(self, intent_name):
+        """Called when a scripted intent is confirmed, starts warming its successors."""
+        if self._previous is not None:
+            self.transitions.setdefault(self._previous, Counter())[intent_name] += 1
+        self._previous = intent_name
+
+        self.predicted = self.predict(intent_name)
+        if self.logger:
+            self.logger.info(f"Prefetching next beats: {self.predicted}")
+        try:
+            self._executor.submit(self._warm, list(self.predicted))
+        except RuntimeError:
+            # Shut down while this turn was being decided
+            pass
+
+    def prepare_posture(self):
+        """Between beats: get into the posture the predicted next beat needs."""
+        if not self.predicted:
+            return
+        gestures = self.dialogflow.get_gestures(self.predicted[0])
+        if gestures and self.nao.posture != "Stand":
+            self.nao.set_stand()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    def _warm(self, intents):
+        for intent_name in intents:
+            gestures = self.dialogflow.get_gestures(intent_name)
+            timeline = self.dialogflow.get_timeline(intent_name)
+            line = self.script_lines.get(intent_name)
+            try:
+                for g in gestures:
+                    if not g.startswith("animations/"):
+                        self.nao.retimer.get(g, tempo=timeline.get("tempo"), speed=timeline.get("speed", 1.0))
+                for warmer in self.warmers:
+                    warmer(intent_name, gestures, line)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Prefetch of '{intent_name}' failed: {e}")
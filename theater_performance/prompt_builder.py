@@ -0,0 +1,120 @@
+"""
+Chat prompts for the LLM fallback, packed into a fixed token budget.
+
+A prompt is a list of chat messages, always in this order:
+
+    system      SYSTEM_MESSAGE, the same for every request
+    system      the persona of the current act
+    user/assistant pairs of earlier exchanges, oldest first
+    user        what was just said
+
+The first two only change when the act does, so consecutive requests share their
+prefix (which the provider can cache). Earlier exchanges are added newest first
+while the whole prompt stays within LLM_PROMPT_TOKENS; older ones are dropped.
+
+Tokens are counted with tiktoken when it is installed, otherwise estimated from
+the text length (about four characters per token for English).
+"""
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+from theater_performance.config import LLM_MODEL, LLM_PROMPT_TOKENS
+
+
+SYSTEM_MESSAGE = "You are NAO the robot in a theatre show. Respond with short dry humor."
+
+# Act -> how NAO sees dancing in that act (see acts.ACTS)
+ACT_PERSONAS = {
+    "INTRODUCTION": "You just met the audience. You are polite, curious and sure robots do not dance.",
+    "DENIAL": "You insist you cannot dance, dancing is just unstructured movement and you prefer counting beats.",
+    "DOUBT": "You start to suspect that what you just did might have been dancing, and you do not like it.",
+    "LEARNING": "You are trying to dance, carefully, and are a little proud of every move that works.",
+    "ACCEPTANCE": "You accept that you can dance. You call it your dance algorithm and act as if it was always your idea.",
+}
+
+# Chat format overhead: tokens per message and for priming the reply
+MESSAGE_TOKENS = 4
+REPLY_TOKENS = 3
+
+
+class TokenCounter:
+    """Token counts for a model, exact with tiktoken and estimated without."""
+
+    def __init__(self, model=LLM_MODEL):
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("o200k_base")
+        # History lines are counted again for every prompt
+        self.count = lru_cache(maxsize=256)(self._count)
+
+    @property
+    def exact(self):
+        return self.encoding is not None
+
+    def _count(self, text):
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        return max((len(text) + 3) // 4, len(text.split()))
+
+    def messages(self, messages):
+        """Tokens of a chat prompt, including the per-message overhead."""
+        return sum(self.count(m["content"]) + MESSAGE_TOKENS for m in messages) + REPLY_TOKENS
+
+
+class PromptBuilder:
+    """Builds the chat messages for a fallback reply within budget tokens."""
+
+    def __init__(self, budget=LLM_PROMPT_TOKENS, personas=ACT_PERSONAS, counter=None):
+        self.budget = budget
+        self.personas = personas
+        self.counter = counter or TokenCounter()
+        # Tokens of the last prompt built
+        self.tokens = 0
+
+    def build(self, state, history, user_input):
+        """
+        Messages for answering user_input in act state.
+
+        history is a list of (user input, reply) pairs, oldest first.
+        """
+        head = [{"role": "system", "content": SYSTEM_MESSAGE}]
+        persona = self.personas.get(state)
+        if persona:
+            head.append({"role": "system", "content": persona})
+
+        used = self.counter.messages(head)
+        question = self._fit(user_input or "", self.budget - used - MESSAGE_TOKENS)
+        used += self.counter.count(question) + MESSAGE_TOKENS
+
+        exchanges = []
+        for said, reply in reversed(history):
+            cost = self.counter.count(said) + self.counter.count(reply) + 2 * MESSAGE_TOKENS
+            if used + cost > self.budget:
+                break
+            exchanges.append(({"role": "user", "content": said}, {"role": "assistant", "content": reply}))
+            used += cost
+
+        self.tokens = used
+        messages = head
+        for pair in reversed(exchanges):
+            messages.extend(pair)
+        messages.append({"role": "user", "content": question})
+        return messages
+
+    def _fit(self, text, tokens):
+        """text, cut to its first words if it is over tokens."""
+        if self.counter.count(text) <= tokens:
+            return text
+        words = text.split()
+        while words and self.counter.count(" ".join(words)) > tokens:
+            words = words[:len(words) * 3 // 4]
+        return " ".join(words)
@@ -0,0 +1,349 @@
+"""
+Offline show replay.
+
+Runs the full show through TheaterPerformanceApp.run without a robot, Dialogflow CX
+or OpenAI: Nao, DialogflowCX, GPT and the OpenAI client are swapped for local
+stand-ins that replay the turns of a scenario file (transcript, intent and line, or
+the LLM reply) with lognormal latencies, and take as long as NAO would to move and
+speak. The show clock runs --speed times faster than real time, so a show takes
+seconds and the latency report is still in show time.
+
+    python -m theater_performance.replay [scenario.json] --speed 20 --seed 1
+    python -m theater_performance.replay --budget nao.say=6000 --budget cx.detect_intent=1500
+
+Only redis-server has to be running (SICApplication logs through it). The run happens
+in a scratch directory (--workdir to keep caches between runs), the report is written
+to <workdir>/reports. With --budget the exit code is 1 when a stage's p95 (ms) is over
+budget, for CI.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from os.path import abspath, dirname, join
+from types import SimpleNamespace
+
+from theater_performance import clock
+
+
+DEFAULT_SCENARIO = join(dirname(abspath(__file__)), "scenarios", "full_show.json")
+
+
+class World:
+    """State shared by the stand-ins: the scenario, latency model and what NAO is doing."""
+
+    def __init__(self, scenario, seed=None, tail=2.0):
+        self.turns = deque(scenario["turns"])
+        self.latency = scenario.get("latency", {})
+        self.tail = tail
+        self.rng = random.Random(seed)
+        # transcript -> reply of the turns that fall back to the LLM
+        self.llm_replies = {t["transcript"]: t["llm_reply"] for t in self.turns if t.get("llm_reply")}
+        self.shutdown_event = None
+
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._idle_since = clock.monotonic()
+
+    def sample(self, name, default=(0.0, 0.0)):
+        """Draw a latency in seconds, latency[name] is [median, sigma] of a lognormal."""
+        median, sigma = self.latency.get(name, default)
+        with self._lock:
+            return median * math.exp(sigma * self.rng.gauss(0.0, 1.0))
+
+    def busy(self, seconds):
+        """NAO (or the LLM) is occupied for seconds of show time."""
+        with self._lock:
+            self._busy += 1
+        try:
+            clock.sleep(seconds)
+        finally:
+            with self._lock:
+                self._busy -= 1
+                if not self._busy:
+                    self._idle_since = clock.monotonic()
+
+    def llm_reply(self, user_input):
+        """The scenario reply for the user input of the last prompt message."""
+        return self.llm_replies.get(user_input.strip(), "I have nothing to add.")
+
+    def idle_for(self):
+        """Show time since NAO and the LLM last did something (0 while busy)."""
+        with self._lock:
+            return 0.0 if self._busy else clock.monotonic() - self._idle_since
+
+    def wait_idle(self, seconds):
+        while self.idle_for() < seconds:
+            clock.sleep(0.05)
+
+
+# The world the stand-ins are created in, set by replay()
+WORLD = None
+
+
+class SimConnector:
+    """One NAO connector: requests take as long as the robot would need."""
+
+    def __init__(self, world, name):
+        self.world = world
+        self.name = name
+        self._lock = threading.Lock()
+
+    def request(self, message, block=True):
+        duration = self.world.sample("rpc", (0.01, 0.5)) + self._duration(message)
+        if block:
+            self._run(duration)
+        else:
+            threading.Thread(target=self._run, args=(duration,), daemon=True).start()
+        return None
+
+    def _run(self, duration):
+        # A connector does one thing at a time, like on the robot
+        with self._lock:
+            self.world.busy(duration)
+
+    def _duration(self, message):
+        kind = type(message).__name__
+        latency = self.world.latency
+
+        if kind == "NaoqiTextToSpeechRequest":
+            words = len((message.text or "").split())
+            return self.world.sample("tts_start") + words / latency.get("tts_words_per_second", 2.5)
+        if kind == "AudioRequest":
+            return len(message.waveform) / (2 * message.sample_rate)
+        if kind == "NaoqiAnimationRequest":
+            return self.world.sample("animation", (3.0, 0.0))
+        if kind == "PlayRecording":
+            times = message.motion_recording_message.recorded_times
+            return self.world.sample("recording_setup") + max((t[-1] for t in times if len(t)), default=0.0)
+        if kind == "NaoPostureRequest":
+            return self.world.sample("posture")
+        if kind == "NaoRestRequest":
+            return self.world.sample("rest")
+        return 0.0
+
+    def register_callback(self, callback):
+        pass
+
+    def stop_component(self):
+        pass
+
+
+class SimNao:
+    """Stands in for sic_framework.devices.Nao, every connector is a SimConnector."""
+
+    def __init__(self, ip=None, **kwargs):
+        self.ip = ip
+        self.connectors = {}
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name not in self.connectors:
+            self.connectors[name] = SimConnector(WORLD, name)
+        return self.connectors[name]
+
+
+class SimConf:
+    """Accepts any service configuration."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class SimDialogflowCX:
+    """
+    Replays the scenario turns as CX replies.
+
+    Like an actor, every turn waits for NAO to finish, pauses, speaks the transcript,
+    then the final transcript is recognized (callback) and the reply arrives after the
+    CX latency. When the scenario is exhausted the show is shut down once NAO is idle.
+    """
+
+    def __init__(self, conf=None, input_source=None, **kwargs):
+        self.world = WORLD
+        self._callbacks = []
+
+    def register_callback(self, callback):
+        self._callbacks.append(callback)
+
+    def request(self, message, block=True):
+        world = self.world
+        try:
+            turn = world.turns.popleft()
+        except IndexError:
+            # Let the last turn start before waiting for NAO to go quiet
+            clock.sleep(world.tail)
+            world.wait_idle(world.tail)
+            if world.shutdown_event is not None:
+                world.shutdown_event.set()
+            return SimpleNamespace(transcript="", intent=None, fulfillment_message=None,
+                                   intent_confidence=None, parameters={})
+
+        world.wait_idle(world.sample("actor_pause"))
+        words = len(turn["transcript"].split())
+        clock.sleep(words / world.latency.get("actor_words_per_second", 2.8) + world.sample("stt_final"))
+
+        recognized = SimpleNamespace(response=SimpleNamespace(
+            recognition_result=SimpleNamespace(transcript=turn["transcript"], is_final=True)
+        ))
+        for callback in self._callbacks:
+            callback(recognized)
+
+        clock.sleep(world.sample("cx"))
+        return SimpleNamespace(
+            transcript=turn["transcript"],
+            intent=turn.get("intent"),
+            fulfillment_message=turn.get("fulfillment"),
+            intent_confidence=1.0 if turn.get("intent") else None,
+            parameters={},
+        )
+
+    def stop_component(self):
+        pass
+
+
+class SimGPT:
+    """Stands in for the SIC GPT service."""
+
+    def __init__(self, conf=None, **kwargs):
+        self.world = WORLD
+
+    def request(self, message, block=True):
+        self.world.busy(self.world.sample("gpt"))
+        return SimpleNamespace(response=self.world.llm_reply(message.input))
+
+    def stop_component(self):
+        pass
+
+
+class SimText2Speech:
+    """Stands in for the google-tts service, renders silence as long as the line takes to say."""
+
+    SAMPLE_RATE = 16000
+
+    def __init__(self, conf=None, **kwargs):
+        self.world = WORLD
+
+    def request(self, message, block=True):
+        self.world.busy(self.world.sample("tts_start"))
+        words = len((message.text or "").split())
+        seconds = words / self.world.latency.get("tts_words_per_second", 2.5)
+        return SimpleNamespace(waveform=bytes(2 * int(seconds * self.SAMPLE_RATE)), sample_rate=self.SAMPLE_RATE)
+
+    def stop_component(self):
+        pass
+
+
+class SimOpenAI:
+    """Stands in for the OpenAI client, streams the reply word by word."""
+
+    def __init__(self, api_key=None, **kwargs):
+        self.world = WORLD
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, messages, stream=False, **kwargs):
+        text = self.world.llm_reply(messages[-1]["content"])
+        tokens = [w + " " for w in text.split()]
+        if not stream:
+            self.world.busy(self.world.sample("gpt"))
+            message = SimpleNamespace(content=text)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        return self._stream(tokens)
+
+    def _stream(self, tokens):
+        for i, token in enumerate(tokens):
+            self.world.busy(self.world.sample("gpt_first_token" if i == 0 else "gpt_token"))
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+
+
+def _install():
+    """Swap the stand-ins into the modules the show uses."""
+    from theater_performance import devices, dialogflow_handler, llm_handler, tts_cache
+
+    devices.Nao = SimNao
+    dialogflow_handler.DialogflowCX = SimDialogflowCX
+    dialogflow_handler.DialogflowCXConf = SimConf
+    llm_handler.GPT = SimGPT
+    llm_handler.GPTConf = SimConf
+    llm_handler.OpenAI = SimOpenAI
+    tts_cache.Text2Speech = SimText2Speech
+    tts_cache.Text2SpeechConf = SimConf
+    tts_cache.GetSpeechRequest = SimConf
+
+
+def replay(scenario_path=DEFAULT_SCENARIO, speed=20.0, seed=None, workdir=None):
+    """Run one show against the scenario, returns the tracer summary."""
+    global WORLD
+
+    with open(scenario_path) as f:
+        scenario = json.load(f)
+
+    workdir = abspath(workdir or tempfile.mkdtemp(prefix="replay-"))
+    os.makedirs(join(workdir, "conf", "google"), exist_ok=True)
+    keyfile = join(workdir, "conf", "google", "google-key.json")
+    if not os.path.exists(keyfile):
+        with open(keyfile, "w") as f:
+            json.dump({"project_id": "replay"}, f)
+    os.chdir(workdir)
+
+    clock.set_speed(speed)
+    WORLD = World(scenario, seed=seed)
+    _install()
+
+    from theater_performance.main import TheaterPerformanceApp
+    from theater_performance.tracing import tracer
+
+    turns = len(WORLD.turns)
+    wall_start = time.monotonic()
+    show_start = clock.monotonic()
+
+    app = TheaterPerformanceApp()
+    WORLD.shutdown_event = app.shutdown_event
+    try:
+        app.run()
+    except SystemExit:
+        # SICApplication.shutdown() ends with sys.exit
+        pass
+
+    show_time = clock.monotonic() - show_start
+    wall_time = time.monotonic() - wall_start
+    print(f"Replayed {turns} turns: {show_time:.1f}s show time in {wall_time:.1f}s "
+          f"({turns / show_time * 60:.1f} turns/min), workdir {workdir}")
+    return tracer.summary()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a show offline against simulated NAO, CX and GPT.")
+    parser.add_argument("scenario", nargs="?", default=DEFAULT_SCENARIO)
+    parser.add_argument("--speed", type=float, default=20.0, help="show clock speed-up")
+    parser.add_argument("--seed", type=int, default=None, help="seed for the latency model")
+    parser.add_argument("--workdir", default=None, help="run directory (caches, reports), default a temp dir")
+    parser.add_argument("--budget", action="append", default=[], metavar="STAGE=MS",
+                        help="fail if the p95 of STAGE is over MS milliseconds")
+    args = parser.parse_args(argv)
+
+    summary = replay(abspath(args.scenario), speed=args.speed, seed=args.seed, workdir=args.workdir)
+
+    for stage, stats in summary.items():
+        print(f"{stage:32} n={stats['count']:<4} p50={stats['p50_ms']:>9.1f}ms "
+              f"p95={stats['p95_ms']:>9.1f}ms p99={stats['p99_ms']:>9.1f}ms")
+
+    failed = False
+    for budget in args.budget:
+        stage, _, limit = budget.partition("=")
+        p95 = summary.get(stage, {}).get("p95_ms")
+        if p95 is not None and p95 > float(limit):
+            print(f"OVER BUDGET {stage}: p95 {p95}ms > {limit}ms")
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
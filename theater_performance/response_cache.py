@@ -0,0 +1,262 @@
+import json
+import math
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from os.path import abspath, dirname
+
+from theater_performance.config import (
+    LLM_CACHE_FILE,
+    LLM_CACHE_THRESHOLD,
+    LLM_CACHE_TTL,
+    LLM_CACHE_MAX_ENTRIES,
+    LLM_CACHE_MAX_VARIANTS,
+    LLM_CACHE_FRESHNESS,
+    LLM_CACHE_SAVE_DELAY
+)
+
+
+def normalize(text):
+    """Lowercase, drop punctuation and collapse whitespace."""
+    return " ".join(re.findall(r"[a-z0-9']+", (text or "").lower()))
+
+
+def trigrams(text):
+    """Character trigram counts of the normalized text, padded so short words still match."""
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class ResponseCache:
+    """
+    Persistent cache of LLM answers keyed on (state, normalized user input).
+
+    Lookups are fuzzy: the question is compared to earlier questions of the same state
+    by cosine similarity of character trigrams (an inverted trigram index keeps the
+    candidate set small), anything above threshold is a hit.
+
+    - ttl: entries older than this are dropped
+    - max_entries: least recently used entries are evicted beyond this
+    - freshness: probability that a hit is still sent to GPT so another variant
+      gets added (up to max_variants per question); hits pick a random variant
+    - save_delay: stored answers are written to disk by a background thread once
+      none came in for this many seconds; close() writes what is left
+    """
+
+    def __init__(self, path=LLM_CACHE_FILE, threshold=LLM_CACHE_THRESHOLD, ttl=LLM_CACHE_TTL,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, max_variants=LLM_CACHE_MAX_VARIANTS,
+                 freshness=LLM_CACHE_FRESHNESS, save_delay=LLM_CACHE_SAVE_DELAY, logger=None):
+        self.path = abspath(path)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_variants = max_variants
+        self.freshness = freshness
+        self.save_delay = save_delay
+        self.logger = logger
+
+        # (state, key) -> {"answers": [...], "latency": s, "created": t, "used": t}
+        self.entries = {}
+        # state -> trigram -> set of keys, plus the vector and norm of every key
+        self._index = {}
+        self._vectors = {}
+        self._lock = threading.Lock()
+
+        # Background writer: _changed is set by store(), _closing by close()
+        self._changed = threading.Event()
+        self._closing = threading.Event()
+        self._saver = None
+
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.lookup_seconds = 0.0
+
+        self._load()
+
+    # ---- lookup / store ----
+
+    def lookup(self, state, user_input):
+        """Return a cached answer for a similar question, or None."""
+        start = time.perf_counter()
+        key = normalize(user_input)
+
+        with self._lock:
+            match = self._best_match(state, key)
+            entry = self.entries.get((state, match)) if match is not None else None
+
+            if entry is not None and time.time() - entry["created"] > self.ttl:
+                self._remove(state, match)
+                entry = None
+
+            fresh = (
+                entry is not None
+                and len(entry["answers"]) < self.max_variants
+                and random.random() < self.freshness
+            )
+            if entry is None or fresh:
+                self.misses += 1
+                self.lookup_seconds += time.perf_counter() - start
+                return None
+
+            entry["used"] = time.time()
+            answer = random.choice(entry["answers"])
+            self.hits += 1
+            self.saved_seconds += entry["latency"]
+            self.lookup_seconds += time.perf_counter() - start
+
+        if self.logger:
+            self.logger.info(f"LLM cache hit for '{user_input}' (matched '{match}').")
+        return answer
+
+    def store(self, state, user_input, answer, latency):
+        """Remember answer (generated in latency seconds) for user_input in state."""
+        key = normalize(user_input)
+        if not key or not answer:
+            return
+
+        now = time.time()
+        with self._lock:
+            match = self._best_match(state, key)
+            entry = self.entries.get((state, match)) if match is not None else None
+
+            if entry is None:
+                entry = {"answers": [], "latency": latency, "created": now, "used": now}
+                self.entries[(state, key)] = entry
+                self._add_to_index(state, key)
+            else:
+                entry["latency"] = (entry["latency"] + latency) / 2
+                entry["used"] = now
+
+            if answer not in entry["answers"]:
+                entry["answers"] = (entry["answers"] + [answer])[-self.max_variants:]
+
+            self._evict()
+
+        self._schedule_save()
+
+    def report(self):
+        """Hit rate and latency saved since startup."""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "saved_seconds": round(self.saved_seconds, 3),
+                "avg_lookup_us": round(self.lookup_seconds / total * 1e6, 1) if total else 0.0,
+            }
+
+    # ---- index ----
+
+    def _best_match(self, state, key):
+        if not key:
+            return None
+        if (state, key) in self.entries:
+            return key
+
+        vector = trigrams(key)
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        index = self._index.get(state, {})
+
+        candidates = set()
+        for gram in vector:
+            candidates |= index.get(gram, set())
+
+        best, best_score = None, self.threshold
+        for other in candidates:
+            other_vector, other_norm = self._vectors[(state, other)]
+            dot = sum(count * other_vector.get(gram, 0) for gram, count in vector.items())
+            score = dot / (norm * other_norm)
+            if score >= best_score:
+                best, best_score = other, score
+        return best
+
+    def _add_to_index(self, state, key):
+        vector = trigrams(key)
+        self._vectors[(state, key)] = (vector, math.sqrt(sum(v * v for v in vector.values())))
+        index = self._index.setdefault(state, {})
+        for gram in vector:
+            index.setdefault(gram, set()).add(key)
+
+    def _remove(self, state, key):
+        self.entries.pop((state, key), None)
+        vector, _ = self._vectors.pop((state, key), (Counter(), 0))
+        index = self._index.get(state, {})
+        for gram in vector:
+            index.get(gram, set()).discard(key)
+
+    def _evict(self):
+        now = time.time()
+        for state, key in [k for k, e in self.entries.items() if now - e["created"] > self.ttl]:
+            self._remove(state, key)
+
+        overflow = len(self.entries) - self.max_entries
+        if overflow > 0:
+            oldest = sorted(self.entries, key=lambda k: self.entries[k]["used"])[:overflow]
+            for state, key in oldest:
+                self._remove(state, key)
+
+    # ---- persistence ----
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                rows = json.load(f)
+        except (OSError, ValueError) as e:
+            if self.logger:
+                self.logger.error(f"Could not read LLM cache {self.path}: {e}")
+            return
+
+        for row in rows:
+            state, key = row.pop("state"), row.pop("key")
+            self.entries[(state, key)] = row
+            self._add_to_index(state, key)
+        self._evict()
+
+    def _schedule_save(self):
+        self._changed.set()
+        with self._lock:
+            if self._saver is None or not self._saver.is_alive():
+                self._saver = threading.Thread(target=self._save_loop, name="llm-cache-save", daemon=True)
+                self._saver.start()
+
+    def _save_loop(self):
+        while True:
+            self._changed.wait()
+            # Debounce: write once no answer was stored for save_delay seconds
+            while self._changed.is_set() and not self._closing.is_set():
+                self._changed.clear()
+                self._closing.wait(self.save_delay)
+            self._changed.clear()
+            try:
+                self._save()
+            except OSError as e:
+                if self.logger:
+                    self.logger.error(f"Could not write LLM cache {self.path}: {e}")
+            if self._closing.is_set():
+                return
+
+    def close(self):
+        """Write stored answers that are not on disk yet."""
+        self._closing.set()
+        # Wake the writer even if nothing changed since its last write
+        self._changed.set()
+        saver = self._saver
+        if saver is not None:
+            saver.join()
+
+    def _save(self):
+        with self._lock:
+            rows = [dict(entry, state=state, key=key) for (state, key), entry in self.entries.items()]
+        os.makedirs(dirname(self.path), exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(rows, f, indent=1)
+        os.replace(tmp, self.path)
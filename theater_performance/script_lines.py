@@ -0,0 +1,48 @@
+import json
+import os
+import threading
+from os.path import abspath, dirname
+
+from theater_performance.config import SCRIPT_LINES_FILE
+
+
+class ScriptLines:
+    """
+    Fulfillment lines per scripted intent, learned from Dialogflow CX replies.
+
+    The lines only live in the CX agent, so every scripted reply is recorded here
+    (and saved to SCRIPT_LINES_FILE) to know a beat's line before CX returns it.
+    """
+
+    def __init__(self, path=SCRIPT_LINES_FILE, logger=None):
+        self.path = abspath(path)
+        self.logger = logger
+        self.lines = {}
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.lines = json.load(f)
+            except (OSError, ValueError) as e:
+                if self.logger:
+                    self.logger.error(f"Could not read script lines {self.path}: {e}")
+
+    def get(self, intent_name):
+        return self.lines.get(intent_name)
+
+    def learn(self, intent_name, line):
+        """Record the line CX gave for intent_name, saves when it is new or changed."""
+        if not intent_name or not line:
+            return
+
+        with self._lock:
+            if self.lines.get(intent_name) == line:
+                return
+            self.lines[intent_name] = line
+
+            os.makedirs(dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(self.lines, f, indent=1)
+            os.replace(tmp, self.path)
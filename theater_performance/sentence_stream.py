@@ -0,0 +1,112 @@
+import queue
+import re
+import threading
+
+from theater_performance import clock
+from theater_performance.config import LLM_STREAM_CLAUSE_CHARS, LLM_STREAM_TIMEOUT
+
+
+# End of a sentence: . ! ? (possibly repeated / followed by a quote) and then whitespace
+_SENTENCE_END = re.compile(r"[.!?…]+[\"')\]]*\s")
+# End of a clause, only used to cut long sentences
+_CLAUSE_END = re.compile(r"[,;:—]\s")
+# A period after these (or after a single letter, an initial) does not end the sentence
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "e.g", "i.e", "cf", "approx"}
+_LAST_WORD = re.compile(r"([A-Za-z][A-Za-z.]*)$")
+
+
+class SentenceChunker:
+    """Cuts streamed text into speakable pieces at sentence (or long clause) boundaries."""
+
+    def __init__(self, clause_chars=LLM_STREAM_CLAUSE_CHARS):
+        self.clause_chars = clause_chars
+        self.buffer = ""
+
+    def feed(self, text):
+        """Add text, returns the sentences completed by it."""
+        self.buffer += text
+        pieces = []
+        while True:
+            match = _sentence_end(self.buffer)
+            if match is None and len(self.buffer) >= self.clause_chars:
+                match = _CLAUSE_END.search(self.buffer, self.clause_chars // 2)
+            if match is None:
+                break
+            piece = self.buffer[:match.end()].strip()
+            self.buffer = self.buffer[match.end():]
+            if piece:
+                pieces.append(piece)
+        return pieces
+
+    def flush(self):
+        """Return whatever is left once the stream is done."""
+        piece = self.buffer.strip()
+        self.buffer = ""
+        return piece or None
+
+
+def _sentence_end(text):
+    """The first sentence end in text that doesn't follow an abbreviation, or None."""
+    for match in _SENTENCE_END.finditer(text):
+        if match.group().rstrip("\"')] \t\n") != ".":
+            return match
+        word = _LAST_WORD.search(text, 0, match.start())
+        if word is None:
+            return match
+        word = word.group(1).lower()
+        if len(word) > 1 and word not in _ABBREVIATIONS:
+            return match
+    return None
+
+
+class SentenceStream:
+    """
+    Runs a sentence generator on a background thread, so tokens keep arriving
+    while NAO is saying the previous sentence.
+
+    Iterate over it to get the sentences in order; text holds everything received so far.
+    Iteration ends once timeout show seconds have passed without the stream being
+    done (error is then a TimeoutError), and the generator is closed at its next
+    sentence.
+    """
+
+    def __init__(self, sentences, timeout=LLM_STREAM_TIMEOUT):
+        self.text = ""
+        self.error = None
+        self.timeout = timeout
+
+        self._deadline = clock.monotonic() + timeout
+        self._closed = threading.Event()
+        self._queue = queue.Queue()
+        self._done = object()
+        self._thread = threading.Thread(target=self._pump, args=(sentences,), name="llm-stream", daemon=True)
+        self._thread.start()
+
+    def _pump(self, sentences):
+        try:
+            for sentence in sentences:
+                if self._closed.is_set():
+                    sentences.close()
+                    break
+                self.text = f"{self.text} {sentence}".strip()
+                self._queue.put(sentence)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._queue.put(self._done)
+
+    def close(self):
+        """Stop taking sentences from the generator."""
+        self._closed.set()
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=max(self._deadline - clock.monotonic(), 0.0) / clock.speed())
+            except queue.Empty:
+                self.error = TimeoutError(f"reply not finished within {self.timeout}s")
+                self.close()
+                return
+            if item is self._done:
+                return
+            yield item
@@ -0,0 +1,345 @@
+import asyncio
+import itertools
+import threading
+
+from theater_performance import clock
+from theater_performance.config import (
+    PIPELINED_TURNS,
+    PIPELINE_QUEUE_SIZE,
+    BARGE_IN_TAIL,
+    BARGE_IN_OVERLAP,
+    HEAD_TOUCH_INTERRUPTS
+)
+from theater_performance.tracing import tracer
+from theater_performance.turn import Turn, word_overlap
+
+
+# Event kinds, in priority order (lower is handled first)
+SHUTDOWN = "shutdown"
+BUTTON = "button"
+OPERATOR = "operator"
+INTENT = "intent"
+TIMER = "timer"
+
+PRIORITIES = {SHUTDOWN: 0, BUTTON: 1, OPERATOR: 2, INTENT: 3, TIMER: 4}
+
+
+class Event:
+    def __init__(self, kind, payload=None, priority=None):
+        self.kind = kind
+        self.payload = payload
+        self.priority = PRIORITIES.get(kind, len(PRIORITIES)) if priority is None else priority
+
+
+class ShowLoop:
+    """
+    Runs the show as an asyncio event loop.
+
+    Everything that can happen is an Event on one priority queue: detected intents,
+    NAO's buttons, timers, operator commands and shutdown. The loop itself never
+    blocks, the blocking work runs on daemon threads:
+
+        listen  detect_intent in a loop, every reply becomes an INTENT event
+        decide  turns the heard replies into Turns, in order
+        act     performs the turns one at a time; interrupt() cuts the current one short,
+                perform_now() also stops waiting for it
+
+    With PIPELINED_TURNS the next DetectIntentRequest is armed while NAO is still
+    performing, otherwise listening waits until NAO is done. At most queue_size
+    heard lines and decided turns wait between the stages; when a queue is full the
+    oldest entry is dropped (a dropped turn is cancelled), so NAO answers what was
+    said last instead of working through a backlog.
+
+    A touch on NAO's head interrupts the current action (HEAD_TOUCH_INTERRUPTS), the
+    shutdown event ends the loop right away. Other components can add handlers with
+    on(kind, handler), post events with post() from any thread and set timers with
+    schedule(). Handlers run on the loop and must return quickly.
+
+    Barge-in suppression: while NAO speaks (and BARGE_IN_TAIL seconds after), a
+    transcript that mostly repeats NAO's own line is dropped as the mic hearing
+    the robot.
+    """
+
+    def __init__(self, controller, queue_size=PIPELINE_QUEUE_SIZE, logger=None):
+        self.controller = controller
+        self.queue_size = queue_size
+        self.logger = logger
+
+        self.handlers = {BUTTON: [self._on_button], INTENT: [self._on_intent]}
+        # Coroutine functions that run alongside the loop (e.g. the operator console)
+        self.services = []
+        # The turn performed last
+        self.last_turn = None
+
+        self._loop = None
+        self._queue = None
+        self._heard = None
+        self._turns = None
+        self._stopped = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._order = itertools.count()
+
+        self._speech_lock = threading.Lock()
+        self._speaking = None
+        # Resolved by perform_now() to stop waiting for the act being performed
+        self._preempted = None
+        self._last_line = None
+        self._last_line_end = 0.0
+
+    # ---- public API ----
+
+    def on(self, kind, handler):
+        """Call handler(event) for every event of kind."""
+        self.handlers.setdefault(kind, []).append(handler)
+
+    def post(self, kind, payload=None, priority=None):
+        """Queue an event, safe to call from any thread."""
+        if self._loop is None or self._stopped.is_set():
+            return
+        event = Event(kind, payload, priority)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (event.priority, next(self._order), event))
+
+    def schedule(self, seconds, kind, payload=None):
+        """From a handler: post an event after seconds of show time, returns a handle with cancel()."""
+        return self._loop.call_later(seconds / clock.speed(), self.post, kind, payload)
+
+    def run(self, shutdown_event):
+        """Run until the show is finished or shutdown_event is set."""
+        asyncio.run(self._main(shutdown_event))
+
+    def stop(self):
+        self.post(SHUTDOWN)
+
+    @property
+    def speaking(self):
+        """The Turn NAO is performing right now, or None."""
+        return self._speaking
+
+    @property
+    def pending(self):
+        """Number of decided turns waiting to be performed."""
+        return self._turns.qsize() if self._turns is not None else 0
+
+    # Action control, call these from handlers (on the loop)
+
+    def skip(self):
+        """Cut the current turn short, queued turns go on."""
+        self._interrupt()
+
+    def abort(self):
+        """Cut the current turn short and drop the queued ones."""
+        while not self._turns.empty():
+            self._turns.get_nowait()
+        self._interrupt()
+
+    def perform_now(self, turn):
+        """
+        Perform turn right away, instead of whatever is playing or queued.
+
+        The current turn is cancelled and its recorded motion stopped (see
+        NaoActions.stop), then turn starts without waiting for the request the
+        interrupted act is blocked on: once that returns the act sends nothing
+        else. A line NAO is already saying still finishes on the robot.
+        """
+        self.abort()
+        if self._preempted is not None and not self._preempted.done():
+            self._preempted.set_result(None)
+        self._offer(self._turns, turn)
+
+    def _interrupt(self):
+        # The act thread may not have made the turn current yet, cancel it here too
+        turn = self._speaking
+        if turn is not None:
+            turn.cancel()
+        self.controller.interrupt()
+
+    # ---- loop ----
+
+    async def _main(self, shutdown_event):
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.PriorityQueue()
+        self._heard = asyncio.Queue(maxsize=self.queue_size)
+        self._turns = asyncio.Queue(maxsize=self.queue_size)
+
+        # Sources: blocking waits live on daemon threads, never on the loop
+        self._thread(self._watch_shutdown, shutdown_event)
+        self._thread(self._listen_loop)
+        if HEAD_TOUCH_INTERRUPTS:
+            self._thread(self._subscribe_buttons)
+
+        workers = [asyncio.create_task(self._decide_loop()), asyncio.create_task(self._act_loop())]
+        workers += [asyncio.create_task(service()) for service in self.services]
+        try:
+            while True:
+                _, _, event = await self._queue.get()
+                if event.kind == SHUTDOWN:
+                    break
+                for handler in self.handlers.get(event.kind, []):
+                    try:
+                        handler(event)
+                    except Exception as e:
+                        if self.logger:
+                            self.logger.error(f"Handler for {event.kind} failed: {e}")
+        finally:
+            self._stopped.set()
+            self.controller.interrupt()
+            for worker in workers:
+                worker.cancel()
+
+    async def _decide_loop(self):
+        while True:
+            reply, intent_name = await self._heard.get()
+            try:
+                turn = await self._in_thread(self.controller.decide, reply, intent_name)
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Decide stage failed: {e}")
+                self._settle()
+                continue
+            if turn is None:
+                self._settle()
+            else:
+                turn.queued_at = clock.monotonic()
+                self._offer(self._turns, turn)
+
+    async def _act_loop(self):
+        while True:
+            free_at = clock.monotonic()
+            turn = await self._turns.get()
+            turn.free_at = free_at
+            if turn.queued_at is not None:
+                tracer.record("show.queue_wait", clock.monotonic() - turn.queued_at)
+            with self._speech_lock:
+                self._speaking = turn
+
+            self._preempted = self._loop.create_future()
+            acting = self._in_thread(self.controller.act, turn)
+            acting.add_done_callback(self._acted)
+            try:
+                await asyncio.wait({acting, self._preempted}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self.last_turn = turn
+                with self._speech_lock:
+                    self._speaking = None
+                    self._last_line = turn.text
+                    self._last_line_end = clock.monotonic()
+                self._settle()
+
+            if self.controller.finished:
+                self.stop()
+
+    def _offer(self, queue, item):
+        """Queue item, dropping the oldest waiting entry if the queue is full."""
+        if queue.full():
+            dropped = queue.get_nowait()
+            if isinstance(dropped, Turn):
+                dropped.cancel()
+                heard = dropped.user_input
+            else:
+                heard = getattr(dropped[0], "transcript", None)
+            if self.logger:
+                self.logger.info(f"Superseded before NAO got to it, dropped: {heard}")
+        queue.put_nowait(item)
+
+    def _acted(self, acting):
+        if not acting.cancelled() and acting.exception() is not None and self.logger:
+            self.logger.error(f"Act stage failed: {acting.exception()}")
+
+    def _settle(self):
+        # Nothing heard is waiting to be performed: serial listening may go on
+        if self._heard.empty() and self._turns.empty() and self._speaking is None:
+            self._idle.set()
+
+    def _in_thread(self, func, *args):
+        """Await func(*args) run on a daemon thread (never blocks interpreter exit)."""
+        future = self._loop.create_future()
+
+        def run():
+            try:
+                result, error = func(*args), None
+            except BaseException as e:
+                result, error = None, e
+            try:
+                self._loop.call_soon_threadsafe(_resolve, future, result, error)
+            except RuntimeError:
+                # The loop was closed (show over) while this was running
+                pass
+
+        self._thread(run)
+        return future
+
+    def _thread(self, target, *args):
+        threading.Thread(target=target, args=args, name=f"show-{target.__name__}", daemon=True).start()
+
+    # ---- sources ----
+
+    def _watch_shutdown(self, shutdown_event):
+        shutdown_event.wait()
+        self.post(SHUTDOWN)
+
+    def _listen_loop(self):
+        while not self._stopped.is_set():
+            if not PIPELINED_TURNS:
+                self._idle.wait()
+                self._idle.clear()
+            try:
+                reply, intent_name = self.controller.dialogflow.detect_intent()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Listen stage failed: {e}")
+                self._idle.set()
+                self._stopped.wait(0.5)
+                continue
+            self.post(INTENT, (reply, intent_name))
+
+    def _subscribe_buttons(self):
+        try:
+            self.controller.nao.nao.buttons.register_callback(
+                lambda message: self.post(BUTTON, getattr(message, "value", None))
+            )
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Could not subscribe to NAO's buttons: {e}")
+
+    # ---- handlers ----
+
+    def _on_intent(self, event):
+        reply, intent_name = event.payload
+        if self._is_echo(reply):
+            if self.logger:
+                self.logger.info(f"Ignoring NAO's own voice: {reply.transcript}")
+            self._settle()
+            return
+        self._offer(self._heard, (reply, intent_name))
+
+    def _on_button(self, event):
+        # ALTouch reports [[name, pressed], ...] on every change
+        pressed = [name for name, state in (event.payload or []) if state and str(name).startswith("Head/Touch")]
+        if pressed and self._speaking is not None:
+            if self.logger:
+                self.logger.info(f"Head touched ({', '.join(pressed)}), interrupting NAO.")
+            self.controller.interrupt()
+
+    def _is_echo(self, reply):
+        if not reply or not reply.transcript:
+            return False
+
+        with self._speech_lock:
+            if self._speaking is not None:
+                line = self._speaking.text
+            elif clock.monotonic() - self._last_line_end <= BARGE_IN_TAIL:
+                line = self._last_line
+            else:
+                return False
+
+        return word_overlap(reply.transcript, line) >= BARGE_IN_OVERLAP
+
+
+def _resolve(future, result, error):
+    if future.cancelled():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import Future
+
+from theater_performance import clock
+from theater_performance.tracing import tracer
+
+
+class Startup:
+    """
+    Brings the show's subsystems up concurrently.
+
+    Each component is added with a factory, the components it requires and an optional
+    readiness probe. start() runs every factory on its own thread as soon as its
+    requirements are ready (their objects are passed as arguments), then the probe;
+    only then is the component ready. get() waits for one component, so callers only
+    block on what they actually need.
+    """
+
+    def __init__(self, logger=None):
+        self.logger = logger
+        self.timings = {}
+
+        self._components = {}
+        self._futures = {}
+        self._started = None
+
+    def add(self, name, factory, requires=(), probe=None):
+        """Register a component, requires must have been added before."""
+        for dependency in requires:
+            if dependency not in self._components:
+                raise ValueError(f"Component '{name}' requires unknown component '{dependency}'.")
+        self._components[name] = (factory, tuple(requires), probe)
+        self._futures[name] = Future()
+
+    def start(self):
+        self._started = clock.monotonic()
+        for name in self._components:
+            threading.Thread(target=self._bring_up, args=(name,), name=f"startup-{name}", daemon=True).start()
+
+    def get(self, name, timeout=None):
+        """The component once it is ready, raises the error if it failed to start."""
+        return self._futures[name].result(timeout)
+
+    def elapsed(self):
+        """Seconds since start()."""
+        return clock.monotonic() - self._started
+
+    def ready(self, name):
+        future = self._futures[name]
+        return future.done() and future.exception() is None
+
+    def wait(self, timeout=None):
+        """Wait for every component, returns the names that failed."""
+        return [name for name, future in self._futures.items() if future.exception(timeout) is not None]
+
+    def _bring_up(self, name):
+        factory, requires, probe = self._components[name]
+        future = self._futures[name]
+        try:
+            dependencies = [self.get(d) for d in requires]
+
+            start = clock.monotonic()
+            component = factory(*dependencies)
+            if probe is not None:
+                probe(component)
+            seconds = clock.monotonic() - start
+
+        except BaseException as e:
+            if self.logger:
+                self.logger.error(f"Startup of {name} failed: {e}")
+            future.set_exception(e)
+            return
+
+        self.timings[name] = seconds
+        tracer.record(f"startup.{name}", seconds)
+        if self.logger:
+            self.logger.info(
+                f"Started {name} in {seconds:.2f}s (ready {self.elapsed():.2f}s after start)"
+            )
+        future.set_result(component)
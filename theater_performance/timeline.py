@@ -0,0 +1,164 @@
+import threading
+
+from theater_performance import clock
+from theater_performance.config import TIMELINE_DEFAULT_ALIGN
+
+
+ALIGN_MODES = ("start", "finish_together", "sequential")
+
+
+class Cue:
+    """One gesture or spoken line, placed on a lane (connector) of a timeline."""
+
+    def __init__(self, lane, kind, target, start=0.0, duration=0.0, options=None):
+        self.lane = lane            # "motion", "motion_record" or "tts"
+        self.kind = kind            # "gesture" or "speech"
+        self.target = target        # animation / motion name, or the text to say
+        self.start = start          # planned start, seconds from the beginning of the beat
+        self.duration = duration    # estimated duration in seconds
+        self.options = options or {}  # extra do_gesture / say arguments (tempo, speed, on_audio)
+
+    @property
+    def end(self):
+        return self.start + self.duration
+
+
+class Timeline:
+    """
+    Plans the gestures and speech of one beat on a shared clock and plays them concurrently.
+
+    Each connector (motion, motion_record, tts) is a lane. Cues on the same lane play in
+    order, lanes run in parallel, so a beat lasts as long as its longest lane.
+
+    The per-intent "timeline" entry in DialogflowHandler.scripted_intents controls planning:
+        align           "start" (default): every lane starts at 0 (+ offsets)
+                        "finish_together": lanes are shifted so they all end together
+                        "sequential": old behaviour, gestures in order and then the line
+                        (built-in animations don't block, recorded motions do)
+        offsets         {gesture name: seconds} extra delay before a gesture
+        speech_offset   seconds before the line starts
+        tempo           BPM the recorded motions of the beat are synced to
+        speed           playback speed of the recorded motions (1 = as recorded)
+    """
+
+    def __init__(self, cues, align="start", logger=None):
+        self.cues = cues
+        self.align = align
+        self.logger = logger
+        self.cancelled = threading.Event()
+        # Called once, right before the first cue is sent to the robot
+        self.on_start = None
+        self._started = threading.Lock()
+
+    @classmethod
+    def plan(cls, nao, gestures, line, spec=None, logger=None):
+        """Build the timeline for a beat, nao is the NaoActions used for duration estimates."""
+        spec = spec or {}
+        align = spec.get("align", TIMELINE_DEFAULT_ALIGN)
+        if align not in ALIGN_MODES:
+            raise ValueError(f"Unknown timeline align '{align}', expected one of {ALIGN_MODES}.")
+        offsets = spec.get("offsets", {})
+
+        retiming = {key: spec[key] for key in ("tempo", "speed") if key in spec}
+
+        cues = []
+        for g in gestures:
+            if g.startswith("animations/"):
+                cues.append(Cue("motion", "gesture", g, offsets.get(g, 0.0), nao.gesture_duration(g)))
+            else:
+                duration = nao.gesture_duration(g, **retiming)
+                cues.append(Cue("motion_record", "gesture", g, offsets.get(g, 0.0), duration, retiming))
+        if line:
+            cues.append(Cue("tts", "speech", line, spec.get("speech_offset", 0.0), nao.speech_duration(line)))
+
+        if align == "sequential":
+            cursor = 0.0
+            for cue in cues:
+                cue.start = cursor + cue.start
+                cursor = cue.end
+            return cls(cues, align, logger)
+
+        # Cues on one lane can't overlap, push each one behind its predecessor
+        lane_end = {}
+        for cue in cues:
+            cue.start = max(cue.start, lane_end.get(cue.lane, 0.0))
+            lane_end[cue.lane] = cue.end
+
+        if align == "finish_together" and lane_end:
+            total = max(lane_end.values())
+            for cue in cues:
+                cue.start += total - lane_end[cue.lane]
+
+        return cls(cues, align, logger)
+
+    @property
+    def duration(self):
+        return max((cue.end for cue in self.cues), default=0.0)
+
+    def lanes(self):
+        """Cues grouped per lane, in play order."""
+        lanes = {}
+        for cue in sorted(self.cues, key=lambda c: c.start):
+            lanes.setdefault(cue.lane, []).append(cue)
+        return lanes
+
+    def run(self, nao):
+        """
+        Play the timeline on NaoActions nao, returns when every lane is done.
+
+        A lane that fails stops the others from starting new cues, its exception is
+        raised here once every lane has finished.
+        """
+        if self.logger:
+            plan = ", ".join(f"{c.lane}@{c.start:.1f}s:{c.target}" for c in self.cues)
+            self.logger.info(f"Timeline ({self.align}, ~{self.duration:.1f}s): {plan}")
+
+        t0 = clock.monotonic()
+
+        if self.align == "sequential":
+            for cue in self.cues:
+                if self.cancelled.is_set():
+                    return
+                self._perform(nao, cue, block=False)
+            return
+
+        errors = []
+        threads = [
+            threading.Thread(target=self._play_lane, args=(nao, lane, cues, t0, errors), name=f"timeline-{lane}")
+            for lane, cues in self.lanes().items()
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        # Every failure was logged by its lane, the first one fails the beat
+        if errors:
+            raise errors[0]
+
+    def cancel(self):
+        """Stop starting new cues (cues already sent to the robot still finish)."""
+        self.cancelled.set()
+
+    def _play_lane(self, nao, lane, cues, t0, errors):
+        try:
+            for cue in cues:
+                delay = t0 + cue.start - clock.monotonic()
+                if delay > 0 and clock.wait(self.cancelled, delay):
+                    return
+                if self.cancelled.is_set():
+                    return
+                self._perform(nao, cue, block=True)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Timeline lane '{lane}' failed at {cue.target}: {e!r}")
+            errors.append(e)
+            self.cancel()
+
+    def _perform(self, nao, cue, block):
+        if self.on_start is not None and self._started.acquire(blocking=False):
+            self.on_start()
+        if cue.kind == "speech":
+            nao.say(cue.target, **cue.options)
+        else:
+            nao.do_gesture(cue.target, block=block, **cue.options)
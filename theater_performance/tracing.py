@@ -0,0 +1,217 @@
+"""
+Latency tracing for the show.
+
+Wrap a stage with the span context manager or the traced decorator:
+
+    with tracer.span("cx.detect_intent"):
+        ...
+
+    @traced("nao.say")
+    def say(self, text): ...
+
+Durations go into per-thread HDR-style histograms (no lock on the recording path),
+summary() merges them into p50/p95/p99 per stage and write_report() saves a JSON
+report per show in TRACE_REPORT_DIR. The histograms of finished threads are folded
+into one total, so short-lived threads don't pile up.
+"""
+import functools
+import json
+import os
+import threading
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from os.path import abspath, join
+
+from theater_performance import clock
+from theater_performance.config import TRACE_REPORT_DIR
+
+
+class Histogram:
+    """
+    Log-linear bucketed histogram of integer values (microseconds here).
+
+    Values below 128 get their own bucket, above that every power of two is split
+    into 64 buckets, so any value is stored with under 1.6% error.
+    """
+
+    SUB_BUCKETS = 64
+
+    def __init__(self):
+        self.counts = Counter()
+        self.total = 0
+        self.count = 0
+        self.max = 0
+
+    @classmethod
+    def index(cls, value):
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - 7
+        return (shift << 6) + (value >> shift)
+
+    @classmethod
+    def value_at(cls, index):
+        """Midpoint of the values that fall in bucket index."""
+        if index < 2 * cls.SUB_BUCKETS:
+            return index
+        shift = (index >> 6) - 1
+        mantissa = index - (shift << 6)
+        return (mantissa << shift) + ((1 << shift) - 1) / 2
+
+    def record(self, value):
+        value = max(int(value), 0)
+        self.counts[self.index(value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def copy(self):
+        """A copy that is safe to take while another thread records."""
+        copy = Histogram()
+        copy.counts = Counter(_snapshot(self.counts))
+        copy.count = sum(copy.counts.values())
+        copy.total = self.total
+        copy.max = self.max
+        return copy
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self.value_at(index), self.max)
+        return float(self.max)
+
+
+class Tracer:
+    """Per-stage latency histograms, recorded per thread and merged on export."""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self._local = threading.local()
+        # (weakref to thread, its histograms) of the threads that recorded
+        self._registry = []
+        # stage -> histogram of the threads that have finished
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def _histograms(self):
+        histograms = getattr(self._local, "histograms", None)
+        if histograms is None:
+            histograms = self._local.histograms = {}
+            # Only taken once per thread, recording itself never locks
+            with self._lock:
+                self._retire()
+                self._registry.append((weakref.ref(threading.current_thread()), histograms))
+        return histograms
+
+    def _retire(self):
+        """Fold the histograms of finished threads into _retired, with _lock held."""
+        alive = []
+        for ref, histograms in self._registry:
+            thread = ref()
+            if thread is not None and thread.is_alive():
+                alive.append((ref, histograms))
+                continue
+            for stage, histogram in histograms.items():
+                self._retired.setdefault(stage, Histogram()).merge(histogram)
+        self._registry = alive
+
+    def record(self, stage, seconds):
+        histograms = self._histograms()
+        histogram = histograms.get(stage)
+        if histogram is None:
+            histogram = histograms[stage] = Histogram()
+        histogram.record(seconds * 1e6)
+
+    @contextmanager
+    def span(self, stage):
+        start = clock.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, clock.perf_counter() - start)
+
+    def summary(self):
+        """{stage: {count, mean_ms, p50_ms, p95_ms, p99_ms, max_ms}}"""
+        with self._lock:
+            self._retire()
+            merged = {stage: histogram.copy() for stage, histogram in self._retired.items()}
+            registry = [histograms for _, histograms in self._registry]
+        # Live threads keep recording while they are merged, merge copies
+        for histograms in registry:
+            for stage, histogram in _snapshot(histograms).items():
+                merged.setdefault(stage, Histogram()).merge(histogram.copy())
+
+        return {
+            stage: {
+                "count": h.count,
+                "mean_ms": round(h.total / h.count / 1000, 2),
+                "p50_ms": round(h.percentile(50) / 1000, 2),
+                "p95_ms": round(h.percentile(95) / 1000, 2),
+                "p99_ms": round(h.percentile(99) / 1000, 2),
+                "max_ms": round(h.max / 1000, 2),
+            }
+            for stage, h in sorted(merged.items())
+        }
+
+    def log_summary(self, logger):
+        for stage, stats in self.summary().items():
+            logger.info(
+                f"{stage}: n={stats['count']} p50={stats['p50_ms']}ms "
+                f"p95={stats['p95_ms']}ms p99={stats['p99_ms']}ms max={stats['max_ms']}ms"
+            )
+
+    def write_report(self, directory=TRACE_REPORT_DIR, extra=None):
+        """Save the summary as reports/show-<start time>.json, returns the path."""
+        directory = abspath(directory)
+        os.makedirs(directory, exist_ok=True)
+        path = join(directory, f"show-{self.started:%Y%m%d-%H%M%S}.json")
+
+        report = {
+            "started": self.started.isoformat(timespec="seconds"),
+            "written": datetime.now().isoformat(timespec="seconds"),
+            "stages": self.summary(),
+        }
+        if extra:
+            report.update(extra)
+
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        return path
+
+
+def _snapshot(mapping):
+    """dict(mapping), retried if another thread changes it meanwhile."""
+    while True:
+        try:
+            return dict(mapping)
+        except RuntimeError:
+            pass
+
+
+# One tracer for the whole show
+tracer = Tracer()
+
+
+def traced(stage):
+    """Decorator: record every call of the function as a span of stage."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracer.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
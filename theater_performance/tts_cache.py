@@ -0,0 +1,156 @@
+"""
+Content-addressed cache of pre-rendered TTS audio for the script lines.
+
+Every line is stored as cache/tts/<sha256 of voice + text>.wav, so a changed line
+in the CX agent simply gets a new file. Build the cache before the show with:
+    python -m theater_performance.tts_cache
+which renders the opening line and every line in SCRIPT_LINES_FILE (learned from
+Dialogflow CX during rehearsals) through the google-tts service (run-google-tts).
+
+Lines that are not cached (LLM replies, changed lines) are said with NAO's own TTS,
+or with TTS_LIVE_ENGINE "google" rendered live in the same TTS_VOICE.
+"""
+import hashlib
+import json
+import os
+import threading
+import wave
+from os.path import abspath, join, exists
+
+# google-tts is an optional SIC extra, only needed to build the cache and with TTS_LIVE_ENGINE "google"
+try:
+    from sic_framework.services.google_tts.google_tts import (
+        GetSpeechRequest,
+        Text2Speech,
+        Text2SpeechConf
+    )
+except ImportError:
+    GetSpeechRequest = Text2Speech = Text2SpeechConf = None
+
+from theater_performance.config import (
+    OPENING_LINE,
+    TTS_CACHE_DIR,
+    TTS_KEYFILE,
+    TTS_VOICE,
+    TTS_RENDER_MISSING
+)
+
+
+class TTSCache:
+    """Pre-rendered audio per line, loaded from disk on first use and kept in memory."""
+
+    def __init__(self, cache_dir=TTS_CACHE_DIR, voice=TTS_VOICE, render_missing=TTS_RENDER_MISSING, logger=None):
+        self.cache_dir = abspath(cache_dir)
+        self.voice = voice
+        self.render_missing = render_missing
+        self.logger = logger
+
+        # text -> (waveform bytes, sample rate)
+        self._audio = {}
+        self._lock = threading.Lock()
+        self._tts = None
+
+    def key(self, text):
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.voice}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def path(self, text):
+        return join(self.cache_dir, self.key(text) + ".wav")
+
+    def get(self, text):
+        """(waveform, sample_rate) for text, or None on a miss."""
+        if not text:
+            return None
+
+        with self._lock:
+            audio = self._audio.get(text)
+        if audio is not None:
+            return audio
+
+        path = self.path(text)
+        if not exists(path):
+            return None
+
+        with wave.open(path, "rb") as f:
+            audio = (f.readframes(f.getnframes()), f.getframerate())
+        with self._lock:
+            self._audio[text] = audio
+        return audio
+
+    def duration(self, text):
+        """Length of the cached audio in seconds, or None on a miss."""
+        audio = self.get(text)
+        if audio is None:
+            return None
+        waveform, sample_rate = audio
+        return len(waveform) / (2 * sample_rate)
+
+    def warm(self, text):
+        """Get text ready in memory, rendering it first if allowed (used by the prefetcher)."""
+        if self.get(text) is None and self.render_missing:
+            self.render(text)
+            self.get(text)
+
+    def speech(self, text):
+        """(waveform, sample_rate) for text, synthesized now on a miss (not stored)."""
+        audio = self.get(text)
+        if audio is None:
+            audio = self.synthesize(text)
+            if self.logger:
+                self.logger.info(f"Rendered live TTS: {text}")
+        return audio
+
+    def synthesize(self, text):
+        """(waveform, sample_rate) of text in this cache's voice."""
+        reply = self.connect().request(GetSpeechRequest(text=text, voice_name=self.voice))
+        return reply.waveform, reply.sample_rate
+
+    def render(self, text):
+        """Synthesize text with Google TTS and store it, returns the file path."""
+        path = self.path(text)
+        if exists(path):
+            return path
+
+        waveform, sample_rate = self.synthesize(text)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp = path + ".tmp"
+        with wave.open(tmp, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(waveform)
+        os.replace(tmp, path)
+
+        if self.logger:
+            self.logger.info(f"Rendered TTS: {text}")
+        return path
+
+    def connect(self):
+        """The google-tts connector, started on first use."""
+        with self._lock:
+            if self._tts is None:
+                if Text2Speech is None:
+                    raise RuntimeError("google-tts is not installed, install the SIC google-tts extra")
+                with open(abspath(TTS_KEYFILE)) as f:
+                    self._tts = Text2Speech(conf=Text2SpeechConf(keyfile_json=json.load(f)))
+            return self._tts
+
+
+def build(logger=None):
+    """Render the opening line and all learned script lines that are not cached yet."""
+    from theater_performance.script_lines import ScriptLines
+
+    cache = TTSCache(logger=logger)
+    lines = [OPENING_LINE] + list(ScriptLines().lines.values())
+
+    for text in dict.fromkeys(lines):
+        if exists(cache.path(text)):
+            print(f"cached   {text}")
+        else:
+            cache.render(text)
+            print(f"rendered {text}")
+
+
+if __name__ == "__main__":
+    build()
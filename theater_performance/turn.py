@@ -0,0 +1,60 @@
+import re
+import threading
+
+
+class Turn:
+    """
+    What NAO does in response to one user utterance.
+
+    An LLM fallback turn has either a complete line or a SentenceStream (stream)
+    that is spoken sentence by sentence. The times are clock.monotonic():
+    fallback_at is when the fallback reply was started, queued_at when the turn
+    was queued to be performed and free_at when NAO was done with the turn before
+    it. fired_at is set for turns an operator fired. cancel() stops the turn while
+    it is being performed.
+    """
+
+    def __init__(self, intent_name, user_input, gestures=None, line=None, timeline=None,
+                 stream=None, fallback_at=None, final=False, fired_at=None):
+        self.intent_name = intent_name
+        self.user_input = user_input
+        self.gestures = gestures or []
+        self.line = line
+        self.timeline = timeline or {}
+        self.stream = stream
+        self.fallback_at = fallback_at
+        self.final = final
+        self.fired_at = fired_at
+        self.queued_at = None
+        self.free_at = None
+
+        self.cancelled = threading.Event()
+        # Timeline playing this turn, set by PerformanceController.act
+        self.playing = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.playing is not None:
+            self.playing.cancel()
+        if self.stream is not None:
+            self.stream.close()
+
+    @property
+    def text(self):
+        """What NAO says (so far, for a streamed reply)."""
+        if self.stream is not None:
+            return self.stream.text
+        return self.line
+
+
+def _words(text):
+    return re.findall(r"[a-z']+", (text or "").lower())
+
+
+def word_overlap(heard, spoken):
+    """Fraction of the heard words that also occur in the spoken line."""
+    heard_words = _words(heard)
+    if not heard_words:
+        return 0.0
+    spoken_words = set(_words(spoken))
+    return sum(1 for w in heard_words if w in spoken_words) / len(heard_words)